@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试脚本
+用合成数据对比新旧实现的耗时，并校验两者结果一致
+
+使用方法：
+    py scripts/benchmark.py classifier --count 1000000
+    py scripts/benchmark.py answers --sizes 10000 100000 1000000
+    py scripts/benchmark.py images --count 1000000
+    py scripts/benchmark.py email --attachment-mb 200
+    py scripts/benchmark.py html --mb 50
+    py scripts/benchmark.py text --lines 1000000
+    py scripts/benchmark.py imagemap --sizes 1000 4000 16000
+    py scripts/benchmark.py sqlite --count 200000
+"""
+
+import argparse
+import html
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from email.message import EmailMessage
+from pathlib import Path
+
+from parse_chat import (IMAGE_BACK_WINDOW, AnswerTracker, ChatMessage, ChatParser,
+                        DocumentGenerator, MessageClassifier, MessageStore)
+
+# 合成消息使用的发送者和内容片段
+SENDERS = ["孟祥志", "孟秋璇", "四叔", "秋璇", "家长"]
+CONTENT_PARTS = [
+    "这道题怎么做？", "函数的单调性", "帮我看看这个", "好的", "电磁感应那一节",
+    "明天交作业", "氧化还原反应配平", "不明白为什么", "三角函数的图像", "收到",
+    "图片1（可在附件中查看）", "嗯嗯", "能量守恒", "离子方程式", "今天学了导数",
+]
+
+
+def synthetic_messages(count: int, seed: int = 0):
+    """生成合成聊天消息（内容由常见片段随机拼接）"""
+    rng = random.Random(seed)
+    contents = [
+        "，".join(rng.sample(CONTENT_PARTS, rng.randint(1, 4)))
+        for _ in range(1000)
+    ]
+    return [
+        ChatMessage(f"2025-09-01 10:{i // 60 % 60:02d}:{i % 60:02d}",
+                    rng.choice(SENDERS), rng.choice(contents))
+        for i in range(count)
+    ]
+
+
+def _timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"  {label}: {elapsed:.2f} 秒")
+    return result, elapsed
+
+
+def bench_classifier(args):
+    """对比 ChatMessage.analyze 与 MessageClassifier"""
+    print(f"生成 {args.count} 条合成消息...")
+    messages = synthetic_messages(args.count)
+
+    def run_analyze():
+        return [msg.analyze("孟祥志", "孟秋璇") for msg in messages]
+
+    classifier = MessageClassifier("孟祥志", "孟秋璇")
+
+    def run_classifier():
+        return [classifier.classify(msg.sender, msg.content) for msg in messages]
+
+    expected, old_time = _timed("ChatMessage.analyze", run_analyze)
+    actual, new_time = _timed("MessageClassifier", run_classifier)
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"  加速比: {old_time / new_time:.2f}x，结果不一致: {mismatches} 条")
+    return mismatches == 0
+
+
+def _reference_find_answer(question, messages, student_names):
+    """DocumentGenerator._find_answer 的原实现（messages.index 线性查找，O(n²)）"""
+    q_index = messages.index(question)
+    for i in range(q_index + 1, min(q_index + 5, len(messages))):
+        if messages[i].sender in student_names or any(name in messages[i].sender for name in student_names):
+            return messages[i]
+    return None
+
+
+def bench_answers(args):
+    """回答索引：验证与原实现一致，并测量随消息数量的扩展性"""
+    parser = ChatParser(teacher_name="孟祥志", student_name="孟秋璇")
+    classifier = parser.classifier
+
+    ok = True
+    for size in args.sizes:
+        messages = synthetic_messages(size)
+        for msg in messages:
+            classifier.analyze(msg)
+        generator = DocumentGenerator(parser)
+
+        def run():
+            tracker = AnswerTracker(generator._is_student)
+            for i, msg in enumerate(messages):
+                tracker.feed(i, msg)
+            return [messages[tracker.answers[i]] if i in tracker.answers else None
+                    for i, msg in enumerate(messages) if msg.is_question]
+
+        answers, elapsed = _timed(f"{size} 条消息", run)
+        print(f"    每条消息 {elapsed / size * 1e9:.0f} 纳秒")
+
+        if size <= args.verify_limit:
+            questions = [msg for msg in messages if msg.is_question]
+            expected = [_reference_find_answer(q, messages, generator.student_names) for q in questions]
+            mismatches = sum(1 for a, b in zip(expected, answers) if a is not b)
+            print(f"    与原实现不一致: {mismatches} 条")
+            ok = ok and mismatches == 0
+    return ok
+
+
+def _reference_associate_images(messages):
+    """_associate_images_with_questions 的原实现（前5条/后3条窗口扫描），
+    返回每条消息关联的 [(图片引用, 是否拼接在前面)]，不修改消息内容"""
+    notes = [[] for _ in messages]
+    for i, msg in enumerate(messages):
+        if "图片" in msg.content or "附件" in msg.content:
+            for j in range(max(0, i - 5), i):
+                if messages[j].is_question:
+                    notes[j].append((msg.content, False))
+                    break
+            if not notes[i] and i < len(messages) - 1:
+                for j in range(i + 1, min(i + 4, len(messages))):
+                    if messages[j].is_question:
+                        notes[j].append((msg.content, True))
+                        break
+    return notes
+
+
+def bench_images(args):
+    """图片-问题关联：与原窗口扫描实现对比，并测量耗时"""
+    parser = ChatParser(teacher_name="孟祥志", student_name="孟秋璇")
+    messages = synthetic_messages(args.count)
+    for msg in messages:
+        parser.classifier.analyze(msg)
+    parser.messages = MessageStore()
+    parser.messages.extend(messages)
+
+    _, elapsed = _timed("_associate_images_with_questions", parser._associate_images_with_questions)
+    print(f"    每条消息 {elapsed / args.count * 1e9:.0f} 纳秒")
+
+    # 只比较前缀，末尾几条可能被前缀之外的图片消息关联，不参与比较
+    expected = _reference_associate_images(messages[:args.verify_limit])
+    expected = expected[:len(expected) - IMAGE_BACK_WINDOW]
+    store = parser.messages
+    mismatches = sum(1 for i, notes in enumerate(expected)
+                     if notes != store._image_notes.get(i, []))
+    print(f"  与原实现不一致（前 {len(expected)} 条）: {mismatches} 条")
+    return mismatches == 0
+
+
+def _write_synthetic_email(path: Path, attachment_mb: int, image_count: int):
+    """生成一封带HTML正文和大量图片附件的合成邮件"""
+    msg = EmailMessage()
+    msg["Subject"] = "微信聊天记录"
+    lines = []
+    for day in range(1, 29):
+        lines.append(f"<p>—————  2025-10-{day}  —————</p>")
+        lines.append("<p>孟秋璇  19:39</p><p>四叔，帮我看看这道题怎么做</p>")
+        lines.append("<p>孟祥志  22:15</p><p>先画受力分析图</p>")
+    msg.set_content("聊天记录见HTML正文")
+    msg.add_alternative("<html><body>" + "\n".join(lines) + "</body></html>", subtype="html")
+    image_size = attachment_mb * 1024 * 1024 // image_count
+    for i in range(image_count):
+        msg.add_attachment(os.urandom(image_size), maintype="image", subtype="png",
+                           filename=f"图片{i + 1}.png")
+    with open(path, "wb") as f:
+        f.write(bytes(msg))
+
+
+def _write_forwarded_email(path: Path, image_count: int):
+    """生成一封转发邮件：外层只有说明文字，聊天记录和图片都在 message/rfc822 附件中"""
+    inner = EmailMessage()
+    inner["Subject"] = "微信聊天记录"
+    inner.set_content("聊天记录见HTML正文")
+    inner.add_alternative("<html><body><p>—————  2025-10-1  —————</p>"
+                          "<p>孟秋璇  19:39</p><p>四叔，帮我看看这道题怎么做</p>"
+                          "<p>孟祥志  22:15</p><p>先画受力分析图</p></body></html>", subtype="html")
+    for i in range(image_count):
+        inner.add_attachment(os.urandom(1024), maintype="image", subtype="png",
+                             filename=f"图片{i + 1}.png")
+    msg = EmailMessage()
+    msg["Subject"] = "Fwd: 微信聊天记录"
+    msg.set_content("转发的聊天记录见附件")
+    msg.add_attachment(inner)
+    with open(path, "wb") as f:
+        f.write(bytes(msg))
+
+
+def _check_forwarded_email(tmp: Path) -> bool:
+    """转发邮件：流式解析与 msg.walk() 找到的消息和图片应一致"""
+    import email
+    from email import policy
+    from parse_email_chat import extract_from_email_file
+
+    email_path = tmp / "forwarded.eml"
+    _write_forwarded_email(email_path, 3)
+    expected = extract_from_email_file(email_path, streaming=False, attachment_dir=tmp)
+    images = []
+    actual = extract_from_email_file(email_path, streaming=True, attachment_dir=tmp, images=images)
+    with open(email_path, "rb") as f:
+        walked = [part.get_filename() for part in
+                  email.message_from_bytes(f.read(), policy=policy.default).walk()
+                  if part.get_content_maintype() == "image"]
+    found = [image["filename"] for image in images]
+    print(f"  转发邮件: {len(actual)} 条消息（原实现 {len(expected)} 条），"
+          f"{len(found)} 张图片（msg.walk() {len(walked)} 张）")
+    return bool(expected) and actual == expected and found == walked
+
+
+def bench_email(args):
+    """邮件提取：对比整封读入内存与流式解析的耗时和内存峰值，并校验转发邮件的解析结果"""
+    from parse_email_chat import extract_from_email_file
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        email_path = tmp / "mail.eml"
+        _write_synthetic_email(email_path, args.attachment_mb, args.images)
+        print(f"合成邮件: {email_path.stat().st_size / 1024 / 1024:.1f} MB，{args.images} 张图片")
+
+        results = []
+        for label, streaming in (("整封读入内存", False), ("流式解析", True)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            messages = extract_from_email_file(email_path, streaming=streaming, attachment_dir=tmp)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {label}: {elapsed:.2f} 秒，内存峰值 {peak / 1024 / 1024:.1f} MB，{len(messages)} 条消息")
+            results.append(messages)
+        forwarded_ok = _check_forwarded_email(tmp)
+    return results[0] == results[1] and forwarded_ok
+
+
+def _reference_html_to_text(html_content):
+    """parse_html_email_from_string 的原实现中整串正则处理的部分"""
+    text = re.sub(r'<style[^>]*>.*?</style>', '', html_content, flags=re.DOTALL)
+    text = re.sub(r'<script[^>]*>.*?</script>', '', text, flags=re.DOTALL)
+    text = re.sub(r'<[^>]+>', '\n', text)
+    return html.unescape(text)
+
+
+def synthetic_html(size_mb: int, seed: int = 0) -> str:
+    """生成约 size_mb MB 的微信邮件HTML正文"""
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    parts = ["<html><head><style>p { margin: 0; }</style></head><body>"]
+    size = 0
+    day = 0
+    while size < target:
+        day += 1
+        block = [f"<div class=\"day\"><p>—————  2025-{day // 28 % 12 + 1}-{day % 28 + 1}  —————</p>"]
+        for i in range(20):
+            sender = rng.choice(SENDERS)
+            content = html.escape("，".join(rng.sample(CONTENT_PARTS, rng.randint(1, 3))))
+            block.append(f"<p>{sender}&nbsp;&nbsp;{10 + i % 12}:{i * 3 % 60:02d}</p>"
+                         f"<p><span>{content}</span><br/></p><p></p>")
+        block.append("</div>")
+        chunk = "\n".join(block)
+        parts.append(chunk)
+        size += len(chunk.encode("utf-8"))
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def bench_html(args):
+    """HTML正文提取：对比整串正则处理与增量解析的吞吐量"""
+    from parse_email_chat import parse_html_email_from_string, parse_text_content
+
+    content = synthetic_html(args.mb)
+    size_mb = len(content.encode("utf-8")) / 1024 / 1024
+    print(f"合成HTML: {size_mb:.1f} MB")
+
+    expected, old_time = _timed("正则替换", lambda: parse_text_content(_reference_html_to_text(content)))
+    actual, new_time = _timed("增量解析", lambda: parse_html_email_from_string(content))
+    print(f"  吞吐量: 正则替换 {size_mb / old_time:.1f} MB/s，增量解析 {size_mb / new_time:.1f} MB/s")
+    print(f"  {len(actual)} 条消息，结果一致: {expected == actual}")
+    return expected == actual
+
+
+def _reference_parse_text_content(text_content):
+    """parse_text_content 的原实现（每行依次用未编译的模式 re.search）"""
+    messages = []
+    current_message = {}
+    current_content = []
+    current_date = None
+    for line in text_content.split('\n'):
+        line = line.strip()
+        if not line:
+            if current_content and current_message:
+                current_message['content'] = '\n'.join(current_content)
+                messages.append(current_message.copy())
+                current_message = {}
+                current_content = []
+            continue
+        date_sep_match = re.search(r'[—\-]+[\s]*(\d{4}[-/]\d{1,2}[-/]\d{1,2})[\s]*[—\-]+', line)
+        if date_sep_match:
+            current_date = re.sub(r'[/]', '-', date_sep_match.group(1))
+            parts = current_date.split('-')
+            if len(parts) == 3:
+                year, month, day = parts
+                current_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+            continue
+        sender_time_match = re.search(r'^([^\s]+)\s+(\d{1,2}:\d{2})$', line)
+        if sender_time_match:
+            if current_content and current_message:
+                current_message['content'] = '\n'.join(current_content)
+                messages.append(current_message.copy())
+            time_str = sender_time_match.group(2)
+            if current_date:
+                timestamp = f"{current_date} {time_str}:00"
+            else:
+                timestamp = datetime.now().strftime('%Y-%m-%d') + f" {time_str}:00"
+            current_message = {'timestamp': timestamp, 'sender': sender_time_match.group(1)}
+            current_content = []
+            continue
+        time_pattern = r'(\d{4}[-/]\d{1,2}[-/]\d{1,2}[\s,]\d{1,2}:\d{1,2}:\d{1,2})|(\d{4}年\d{1,2}月\d{1,2}日[\s,]\d{1,2}:\d{1,2}:\d{1,2})'
+        time_match = re.search(time_pattern, line)
+        if time_match:
+            if current_content and current_message:
+                current_message['content'] = '\n'.join(current_content)
+                messages.append(current_message.copy())
+            current_message = {'timestamp': time_match.group(0)}
+            current_content = []
+            parts = line.split(time_match.group(0), 1)
+            if len(parts) > 1:
+                sender_part = parts[0].strip()
+                content_part = parts[1].strip()
+                if '：' in sender_part or ':' in sender_part:
+                    current_message['sender'] = sender_part.split('：')[0].split(':')[0].strip()
+                    if content_part:
+                        current_content.append(content_part)
+                else:
+                    words = sender_part.split()
+                    if words:
+                        current_message['sender'] = words[-1]
+                        if content_part:
+                            current_content.append(content_part)
+        elif current_message:
+            current_content.append(line)
+        elif len(line) > 3:
+            timestamp = (current_date + " 00:00:00" if current_date
+                         else datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            for sender_name in ['孟秋璇', '孟祥志', '秋璇', '四叔']:
+                if line.startswith(sender_name):
+                    current_message = {'timestamp': timestamp, 'sender': sender_name}
+                    content = line[len(sender_name):].strip()
+                    if content:
+                        current_content.append(content)
+                    break
+            else:
+                current_message = {'timestamp': timestamp, 'sender': '未知'}
+                current_content.append(line)
+    if current_content and current_message:
+        current_message['content'] = '\n'.join(current_content)
+        messages.append(current_message)
+    return messages
+
+
+def synthetic_export(line_count: int, seed: int = 0):
+    """生成约 line_count 行的微信邮件纯文本导出"""
+    rng = random.Random(seed)
+    lines = []
+    day = 0
+    while len(lines) < line_count:
+        day += 1
+        lines.append(f"—————  2025-{day // 28 % 12 + 1}-{day % 28 + 1}  —————")
+        for i in range(20):
+            lines.append(f"{rng.choice(SENDERS)}  {10 + i % 12}:{i * 3 % 60:02d}")
+            for _ in range(rng.randint(1, 3)):
+                lines.append("，".join(rng.sample(CONTENT_PARTS, rng.randint(1, 3))))
+            lines.append("")
+    return lines[:line_count]
+
+
+def _check_text_file_bom(tmp: Path) -> bool:
+    """ChatParser 解析带 UTF-8 BOM 的文本导出，结果应与不带 BOM 时相同（第一条消息不能丢）"""
+    lines = []
+    for msg in synthetic_messages(1000):
+        lines.append(f"{msg.timestamp} {msg.sender} {msg.content}")
+        lines.append("接上一行的内容")
+    text = "\n".join(lines) + "\n"
+    results = []
+    for name, encoding in (("plain.txt", "utf-8"), ("bom.txt", "utf-8-sig")):
+        path = tmp / name
+        path.write_text(text, encoding=encoding)
+        messages = ChatParser().parse_text_file(path)
+        results.append([(m.timestamp, m.sender, m.content) for m in messages])
+    ok = results[0] == results[1] and len(results[0]) == 1000
+    print(f"  带 BOM 的文本导出: {len(results[1])} 条消息（不带 BOM {len(results[0])} 条），结果一致: {ok}")
+    return ok
+
+
+def bench_text(args):
+    """纯文本聊天记录解析：测量每行耗时，与原实现对比结果，并检查带 BOM 的文本导出"""
+    from parse_email_chat import parse_text_content
+
+    lines = synthetic_export(args.lines)
+    text = "\n".join(lines)
+    print(f"合成导出: {len(lines)} 行")
+
+    expected, old_time = _timed("原实现", lambda: _reference_parse_text_content(text))
+    actual, new_time = _timed("状态机（整串）", lambda: parse_text_content(text))
+    streamed, stream_time = _timed("状态机（逐行输入）", lambda: parse_text_content(iter(lines)))
+    for label, elapsed in (("原实现", old_time), ("状态机（整串）", new_time), ("状态机（逐行输入）", stream_time)):
+        print(f"    {label}: 每行 {elapsed / len(lines) * 1e9:.0f} 纳秒")
+    ok = expected == actual == streamed
+    print(f"  加速比: {old_time / new_time:.2f}x，{len(actual)} 条消息，结果一致: {ok}")
+    with tempfile.TemporaryDirectory() as tmp:
+        ok = _check_text_file_bom(Path(tmp)) and ok
+    return ok
+
+
+def _reference_map_images(images, chat_file):
+    """map_images_to_references 的原实现（按文件名排序，循环中 image_refs.index）"""
+    with open(chat_file, 'r', encoding='utf-8') as f:
+        image_refs = [int(m) for m in re.findall(r'图片(\d+)（可在附件中查看）', f.read())]
+    image_map = {}
+    sorted_images = sorted(images, key=lambda x: x['filename'])
+    for i, img_num in enumerate(sorted(set(image_refs))):
+        if i < len(sorted_images):
+            image_map[img_num] = sorted_images[i]
+    used_indices = set()
+    for img_num in sorted(set(image_refs)):
+        if img_num in image_map:
+            used_indices.add(image_refs.index(img_num) if img_num in image_refs else 0)
+    remaining_refs = sorted(set(image_refs) - set(image_map.keys()))
+    remaining_images = [img for i, img in enumerate(sorted_images) if i not in used_indices]
+    for i, img_num in enumerate(remaining_refs):
+        if i < len(remaining_images):
+            image_map[img_num] = remaining_images[i]
+    return image_map
+
+
+def _check_manifest_renditions(tmp: Path) -> bool:
+    """重新提取图片（再次 assign）后，清单仍链接已生成的缩放版本"""
+    from image_store import ImageStore, load_reference_urls
+
+    manifest = tmp / "image_manifest.json"
+    image = {'filename': "图片1.png", 'data': b"png", 'content_type': "image/png"}
+    store = ImageStore(tmp, manifest)
+    entry = store.assign(1, image)
+    store.set_renditions(entry['sha256'], entry['sha256'] + ".webp", entry['sha256'] + "_thumb.webp")
+    store.save()
+
+    store = ImageStore(tmp, manifest)
+    store.assign(1, image)
+    store.save()
+    kept = load_reference_urls(manifest)[1].endswith(".webp")
+    print(f"  再次提取后仍链接缩放版本: {kept}")
+    return kept
+
+
+def bench_imagemap(args):
+    """图片编号映射：测量随引用数量的扩展性，与原实现对比已映射部分，并检查清单保留缩放版本"""
+    from extract_images_from_email import map_images_to_references
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            # 聊天记录中每个编号被引用两次，图片按 MIME 顺序编号（文件名顺序与之一致）
+            chat_file = Path(tmp) / f"chat_{size}.txt"
+            rng = random.Random(size)
+            refs = list(range(1, size + 1)) * 2
+            rng.shuffle(refs)
+            with open(chat_file, 'w', encoding='utf-8') as f:
+                for ref in refs:
+                    f.write(f"2025-09-01 10:00:00 孟秋璇 图片{ref}（可在附件中查看）\n")
+            images = [{'filename': f"图片{i:06d}.png", 'data': b'', 'order': i} for i in range(size)]
+
+            print(f"{size} 个图片编号（{len(refs)} 处引用）:")
+            actual, elapsed = _timed("单次分配", lambda: map_images_to_references(images, chat_file))
+            print(f"    每处引用 {elapsed / len(refs) * 1e9:.0f} 纳秒")
+            if size <= args.verify_limit:
+                expected, old_time = _timed("原实现", lambda: _reference_map_images(images, chat_file))
+                print(f"    加速比: {old_time / elapsed:.1f}x")
+                mismatches = sum(1 for num, img in actual.items() if expected.get(num) is not img)
+                print(f"    与原实现不一致: {mismatches} 个")
+                ok = ok and mismatches == 0 and len(actual) == size
+        ok = _check_manifest_renditions(Path(tmp)) and ok
+    return ok
+
+
+def _write_synthetic_wechat_db(path: Path, count: int, seed: int = 0):
+    """生成一个消息表，时间戳在 2020-2030 年之间，秒级和毫秒级各占一半"""
+    import sqlite3
+
+    rng = random.Random(seed)
+    low = datetime(2020, 1, 1).timestamp()
+    high = datetime(2030, 12, 31).timestamp()
+    rows = []
+    for i in range(count):
+        t = int(rng.uniform(low, high))
+        rows.append(("秋璇", f"秋璇 数学题 {i}", t * 1000 if i % 2 else t))
+    conn = sqlite3.connect(str(path))
+    with conn:
+        conn.execute("CREATE TABLE message (talker TEXT, content TEXT, create_time INTEGER)")
+        conn.execute("CREATE INDEX message_time ON message (create_time)")
+        conn.executemany("INSERT INTO message VALUES (?, ?, ?)", rows)
+    conn.close()
+    return rows
+
+
+def bench_sqlite(args):
+    """SQLite 提取：日期过滤（含只给一端日期）与逐行换算时间后的过滤结果对比"""
+    from extract_from_sqlite import extract_messages_from_db
+
+    def in_range(t, start_date, end_date):
+        date = datetime.fromtimestamp(t / 1000 if t >= 1e12 else t).strftime("%Y-%m-%d")
+        return (not start_date or date >= start_date) and (not end_date or date <= end_date)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "message.db"
+        rows = _write_synthetic_wechat_db(db_path, args.count)
+        for start_date, end_date in (("2025-09-01", "2025-12-31"), ("2025-09-01", None),
+                                     (None, "2025-12-31"), (None, None)):
+            actual, _ = _timed(f"{start_date or '-'} 至 {end_date or '-'}",
+                               lambda: extract_messages_from_db(db_path, start_date, end_date))
+            expected = {content for _, content, t in rows if in_range(t, start_date, end_date)}
+            found = {msg['content'] for msg in actual}
+            print(f"    {len(found)} 条消息，与逐行过滤一致: {found == expected}")
+            ok = ok and found == expected and len(actual) == len(found)
+    return ok
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    classifier_parser = subparsers.add_parser("classifier", help="关键词分类器")
+    classifier_parser.add_argument("--count", type=int, default=1_000_000, help="合成消息数量")
+    classifier_parser.set_defaults(func=bench_classifier)
+
+    answers_parser = subparsers.add_parser("answers", help="提问-回答索引")
+    answers_parser.add_argument("--sizes", type=int, nargs="+",
+                                default=[10_000, 100_000, 1_000_000], help="测试的消息数量")
+    answers_parser.add_argument("--verify-limit", type=int, default=10_000,
+                                help="不超过该数量时与原 O(n²) 实现对比结果")
+    answers_parser.set_defaults(func=bench_answers)
+
+    images_parser = subparsers.add_parser("images", help="图片-问题关联")
+    images_parser.add_argument("--count", type=int, default=1_000_000, help="合成消息数量")
+    images_parser.add_argument("--verify-limit", type=int, default=100_000,
+                               help="与原实现对比结果的消息数量")
+    images_parser.set_defaults(func=bench_images)
+
+    email_parser = subparsers.add_parser("email", help="邮件流式解析")
+    email_parser.add_argument("--attachment-mb", type=int, default=100, help="附件总大小（MB）")
+    email_parser.add_argument("--images", type=int, default=50, help="图片附件数量")
+    email_parser.set_defaults(func=bench_email)
+
+    html_parser = subparsers.add_parser("html", help="HTML正文提取")
+    html_parser.add_argument("--mb", type=int, default=20, help="合成HTML大小（MB）")
+    html_parser.set_defaults(func=bench_html)
+
+    text_parser = subparsers.add_parser("text", help="纯文本聊天记录解析")
+    text_parser.add_argument("--lines", type=int, default=1_000_000, help="合成导出的行数")
+    text_parser.set_defaults(func=bench_text)
+
+    sqlite_parser = subparsers.add_parser("sqlite", help="SQLite 按日期提取")
+    sqlite_parser.add_argument("--count", type=int, default=200_000, help="合成消息数量")
+    sqlite_parser.set_defaults(func=bench_sqlite)
+
+    imagemap_parser = subparsers.add_parser("imagemap", help="图片编号映射")
+    imagemap_parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 4_000, 16_000],
+                                 help="图片编号数量")
+    imagemap_parser.add_argument("--verify-limit", type=int, default=16_000,
+                                 help="不超过该数量时与原 O(n²) 实现对比结果")
+    imagemap_parser.set_defaults(func=bench_imagemap)
+
+    args = parser.parse_args()
+    ok = args.func(args)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
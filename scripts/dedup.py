@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+消息去重
+按 (时间, 发送者, 内容) 的128位哈希判断重复，只保存定长的摘要而不是完整内容，
+同一时间同一人发的消息才算重复，不同时间重复出现的“好的”等短消息会保留。
+摘要默认保存在内存中；历史记录很大时可以保存在磁盘上的 SQLite 文件中。
+"""
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+from typing import Dict, Iterable, Iterator
+
+# 摘要长度（字节）：16 字节即128位，百亿条消息的碰撞概率也可以忽略
+DIGEST_SIZE = 16
+
+
+def message_digest(timestamp, sender, content, digest_size: int = DIGEST_SIZE) -> bytes:
+    """消息的定长摘要（None 按空字符串处理）"""
+    key = '\x00'.join('' if part is None else str(part) for part in (timestamp, sender, content))
+    return hashlib.blake2b(key.encode('utf-8', errors='surrogatepass'), digest_size=digest_size).digest()
+
+
+class MessageDeduplicator:
+    """消息去重器，统计保留和丢弃的数量
+
+    on_disk 为 True 时摘要保存在 SQLite 文件中（db_path 为 None 时使用临时文件，关闭时删除）。
+    """
+
+    def __init__(self, on_disk: bool = False, db_path=None, digest_size: int = DIGEST_SIZE):
+        self.digest_size = digest_size
+        self.kept = 0
+        self.dropped = 0
+        self._seen = None
+        self._conn = None
+        self._temp_path = None
+        if on_disk:
+            if db_path is None:
+                fd, db_path = tempfile.mkstemp(prefix="dedup_", suffix=".sqlite")
+                os.close(fd)
+                self._temp_path = db_path
+            self._conn = sqlite3.connect(str(db_path))
+            # 摘要丢失只影响本次去重，不需要日志和同步写盘
+            self._conn.execute("PRAGMA journal_mode=OFF")
+            self._conn.execute("PRAGMA synchronous=OFF")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS seen (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+        else:
+            self._seen = set()
+
+    def add(self, timestamp, sender, content) -> bool:
+        """记录一条消息，第一次出现时返回 True，重复时返回 False"""
+        digest = message_digest(timestamp, sender, content, self.digest_size)
+        if self._conn is not None:
+            is_new = self._conn.execute("INSERT OR IGNORE INTO seen VALUES (?)", (digest,)).rowcount == 1
+        else:
+            is_new = digest not in self._seen
+            if is_new:
+                self._seen.add(digest)
+        if is_new:
+            self.kept += 1
+        else:
+            self.dropped += 1
+        return is_new
+
+    def unique(self, messages: Iterable[Dict], content_only: bool = False) -> Iterator[Dict]:
+        """依次产出不重复的消息（字典），跳过内容为空的消息
+
+        content_only 为 True 时只按内容判断（用于同一内容被多种方法重复提取、时间和发送者不可靠的情况）。
+        """
+        for msg in messages:
+            content = msg.get('content', '')
+            if not content:
+                continue
+            if content_only:
+                is_new = self.add(None, None, content)
+            else:
+                is_new = self.add(msg.get('timestamp'), msg.get('sender'), content)
+            if is_new:
+                yield msg
+
+    def summary(self) -> str:
+        return f"保留 {self.kept} 条，丢弃重复 {self.dropped} 条"
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._temp_path is not None:
+            try:
+                os.remove(self._temp_path)
+            except OSError:
+                pass
+            self._temp_path = None
+        self._seen = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+邮件统一读取
+流式遍历一次MIME结构，把聊天正文、附件和图片分别交给不同的输出：
+- HTML/纯文本正文保存在内存中
+- 附件边解码边写入附件目录
+- 图片（图片部分、图片附件、Content-ID 内嵌图片）按邮件中的顺序收集
+聊天记录提取和图片提取共用这一步，同一封邮件只需解析一次。
+"""
+
+import io
+from pathlib import Path
+
+from mime_stream import stream_mime_parts
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+
+class EmailContent:
+    """一次遍历邮件得到的内容"""
+    def __init__(self):
+        self.bodies = {}        # "text/html" / "text/plain" -> 正文字节
+        self.charsets = {}      # "text/html" / "text/plain" -> 声明的字符集（可能为 None）
+        self.attachments = []   # (附件文件名, 保存路径)
+        self.images = []        # {'filename', 'data', 'content_type', 'content_id', 'order'}
+
+
+class _Tee:
+    """把同一份数据写入多个输出"""
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, data):
+        for sink in self.sinks:
+            sink.write(data)
+
+
+def _image_info(headers, filename, is_attachment):
+    """判断一个部分是否为图片，返回图片信息（不含数据），不是图片时返回 None"""
+    content_type = headers.get_content_type()
+    content_id = str(headers.get('Content-ID', '')).strip('<> ')
+    if content_type.startswith('image/'):
+        # 没有文件名的内嵌图片用 Content-ID 命名
+        name = filename or (f"image_{content_id}" if content_id else None)
+        if name:
+            return {'filename': name, 'content_type': content_type, 'content_id': content_id}
+    elif is_attachment and filename and filename.lower().endswith(IMAGE_EXTENSIONS):
+        return {'filename': filename, 'content_type': content_type or 'image/jpeg',
+                'content_id': content_id}
+    return None
+
+
+def ingest_email(email_file_path, attachment_dir=None, collect_images=False):
+    """流式读取一封邮件，返回 EmailContent
+
+    attachment_dir 不为 None 时把附件保存到该目录；collect_images 为 True 时收集图片数据。
+    """
+    content = EmailContent()
+    open_files = []
+    image_buffers = []
+    seen_images = set()
+
+    def handle_part(headers, depth):
+        content_disposition = str(headers.get("Content-Disposition", ""))
+        is_attachment = "attachment" in content_disposition.lower()
+        filename = headers.get_filename()
+        sinks = []
+
+        if collect_images:
+            image = _image_info(headers, filename, is_attachment)
+            # 用 Content-ID 命名的内嵌图片可能与已有图片重名，跳过重复的
+            if image and not (filename is None and image['filename'] in seen_images):
+                seen_images.add(image['filename'])
+                image['order'] = len(content.images)
+                buffer = io.BytesIO()
+                content.images.append(image)
+                image_buffers.append((image, buffer))
+                sinks.append(buffer)
+
+        if is_attachment:
+            if filename and attachment_dir is not None:
+                attach_path = Path(attachment_dir) / Path(filename).name
+                try:
+                    attach_file = open(attach_path, 'wb')
+                except OSError as e:
+                    print(f"  保存附件失败 {filename}: {e}")
+                else:
+                    open_files.append(attach_file)
+                    content.attachments.append((filename, attach_path))
+                    sinks.append(attach_file)
+        else:
+            content_type = headers.get_content_type()
+            if depth == 0 and content_type != "text/html":
+                # 单部分邮件：非HTML的都当作纯文本正文
+                content_type = "text/plain"
+            if content_type in ("text/html", "text/plain") and content_type not in content.bodies:
+                buffer = io.BytesIO()
+                content.bodies[content_type] = buffer
+                content.charsets[content_type] = headers.get_content_charset()
+                sinks.append(buffer)
+
+        if not sinks:
+            return None
+        return sinks[0] if len(sinks) == 1 else _Tee(*sinks)
+
+    try:
+        with open(email_file_path, 'rb') as f:
+            stream_mime_parts(f, handle_part)
+    finally:
+        for attach_file in open_files:
+            attach_file.close()
+
+    content.bodies = {key: buffer.getvalue() for key, buffer in content.bodies.items()}
+    for image, buffer in image_buffers:
+        image['data'] = buffer.getvalue()
+    # 没有数据的图片（空的部分）不保留
+    content.images = [image for image in content.images if image['data']]
+    return content
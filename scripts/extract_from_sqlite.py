@@ -5,10 +5,14 @@
 """
 
 import sqlite3
+import argparse
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
 
+from dedup import MessageDeduplicator
+from sqlite_pool import ConnectionPool
+
 # 微信数据目录
 WECHAT_DATA = Path(r"C:\Users\mmeng\Documents\xwechat_files\mengxiangzhi001_8542\db_storage")
 
@@ -18,46 +22,148 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 TARGET_CONTACT = "秋璇"
 
-def query_database(db_path, query):
-    """查询数据库"""
-    try:
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
-        cursor.execute(query)
-        results = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        conn.close()
-        return results, columns
-    except Exception as e:
-        print(f"  查询失败: {e}")
-        return None, None
+# 内容中包含任意一个即认为是相关消息
+CONTENT_KEYWORDS = (TARGET_CONTACT, "您", "我", "数学", "物理", "化学")
+
+# 分页读取：每页行数（按时间和 rowid 接着上一页读），以及每次 fetchmany 的行数
+PAGE_SIZE = 5000
+FETCH_SIZE = 500
+
+# 不小于该值的时间戳按毫秒处理，小于的按秒处理（与写入文件时的判断一致）
+MS_TIMESTAMP_MIN = 1e12
 
-def find_message_tables(db_path):
+def find_message_tables(db_path, pool):
     """查找包含消息的表"""
     try:
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [t[0] for t in cursor.fetchall()]
-        conn.close()
-        
-        # 查找可能包含消息的表
-        message_tables = []
-        for table in tables:
-            if any(keyword in table.lower() for keyword in ['msg', 'message', 'chat', 'talk']):
-                message_tables.append(table)
-        
-        return message_tables
+        tables = pool.tables(db_path)
     except Exception as e:
         print(f"  无法读取表: {e}")
         return []
+    
+    # 查找可能包含消息的表
+    return [table for table in tables
+            if any(keyword in table.lower() for keyword in ['msg', 'message', 'chat', 'talk'])]
+
+def quote_identifier(name):
+    """SQL 标识符加双引号（表名、列名来自数据库本身，不能作为参数传入）"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def detect_columns(conn, table):
+    """用 PRAGMA table_info 读取表结构，识别联系人、内容、时间列（与原来一样，多列匹配时取最后一列）"""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+    
+    contact_col = None
+    content_col = None
+    time_col = None
+    
+    for col in columns:
+        col_lower = col.lower()
+        if any(x in col_lower for x in ['contact', 'user', 'name', 'talker', 'username']):
+            contact_col = col
+        if any(x in col_lower for x in ['content', 'text', 'msg', 'message']):
+            content_col = col
+        if any(x in col_lower for x in ['time', 'timestamp', 'create_time', 'date']):
+            time_col = col
+    
+    return columns, contact_col, content_col, time_col
+
+def has_rowid(conn, table):
+    """WITHOUT ROWID 表没有 rowid，不能按 rowid 分页"""
+    try:
+        conn.execute(f"SELECT rowid FROM {quote_identifier(table)} LIMIT 0")
+        return True
+    except sqlite3.Error:
+        return False
+
+def time_indexed(conn, table, time_col):
+    """时间列是否是某个索引的第一列（没有索引时按时间分页每页都要扫描、排序整张表）"""
+    for index in conn.execute(f"PRAGMA index_list({quote_identifier(table)})").fetchall():
+        first = conn.execute(f"PRAGMA index_info({quote_identifier(index[1])})").fetchone()
+        if first and first[2] == time_col:
+            return True
+    return False
+
+def date_range_params(start_date=None, end_date=None):
+    """把日期范围（YYYY-MM-DD，包含结束日期当天）换成秒级和毫秒级时间戳的 [起, 止) 区间
+    
+    秒级区间限制在 MS_TIMESTAMP_MIN 以下，毫秒级区间从 MS_TIMESTAMP_MIN 开始，
+    只给出一端日期时两个区间也不会重叠。
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d").timestamp() if start_date else 0
+    end = ((datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).timestamp()
+           if end_date else float('inf'))
+    return (start, min(end, MS_TIMESTAMP_MIN),
+            max(start * 1000, MS_TIMESTAMP_MIN), end * 1000)
+
+def iter_keyset_pages(conn, table, select_cols, where, params, time_col, use_rowid):
+    """按 (时间, rowid) 分页读取满足条件的行，每页 PAGE_SIZE 行，用 fetchmany 分批取出
+    
+    每页从上一页最后一行之后开始（不用 OFFSET），整张表只扫描一次，内存占用与表大小无关。
+    时间为 NULL 的行不能参与比较，单独按 rowid 分页。time_col 为 None 时只按 rowid 分页。
+    """
+    table_sql = quote_identifier(table)
+    cols_sql = ", ".join(quote_identifier(c) for c in select_cols)
+    
+    if not use_rowid:
+        # 没有 rowid 时不分页，直接流式读取
+        order = f" ORDER BY {quote_identifier(time_col)}" if time_col else ""
+        cursor = conn.execute(f"SELECT {cols_sql} FROM {table_sql} WHERE {where}{order}", params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            yield from rows
+    
+    # (附加条件, 排序键列)；keys 中是上一页最后一行的排序键
+    phases = []
+    if time_col:
+        time_sql = quote_identifier(time_col)
+        phases.append((f"{time_sql} IS NULL", ["rowid"]))
+        phases.append((f"{time_sql} IS NOT NULL", [time_col, "rowid"]))
+    else:
+        phases.append(("1", ["rowid"]))
+    
+    for phase_where, key_cols in phases:
+        key_sql = [quote_identifier(c) if c != "rowid" else "rowid" for c in key_cols]
+        base = (f"SELECT {cols_sql}, {', '.join(key_sql)} FROM {table_sql} "
+                f"WHERE {where} AND {phase_where}")
+        order = f" ORDER BY {', '.join(key_sql)} LIMIT {PAGE_SIZE}"
+        keys = None
+        while True:
+            if keys is None:
+                cursor = conn.execute(base + order, params)
+            elif len(keys) == 1:
+                cursor = conn.execute(base + " AND rowid > ?" + order, (*params, keys[0]))
+            else:
+                cursor = conn.execute(base + f" AND ({key_sql[0]} > ? OR ({key_sql[0]} = ? AND rowid > ?))" + order,
+                                      (*params, keys[0], keys[0], keys[1]))
+            count = 0
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                count += len(rows)
+                for row in rows:
+                    yield row[:len(select_cols)]
+                keys = rows[-1][len(select_cols):]
+            if count < PAGE_SIZE:
+                break
 
-def extract_messages_from_db(db_path):
-    """从数据库提取消息"""
+def extract_messages_from_db(db_path, start_date=None, end_date=None, pool=None):
+    """从数据库提取消息
+    
+    过滤条件都放进 SQL（参数化），只读取联系人、内容、时间三列；按时间分页读完整张表，
+    不再截断到前 10000 行。日期范围（YYYY-MM-DD）为空时不限制。
+    pool 为连接池（查找表和提取共用一个连接），为 None 时临时打开、用完关闭。
+    """
+    if pool is None:
+        with ConnectionPool() as pool:
+            return extract_messages_from_db(db_path, start_date, end_date, pool)
+    
     print(f"\n处理数据库: {db_path.name}")
     
     # 查找消息表
-    message_tables = find_message_tables(db_path)
+    message_tables = find_message_tables(db_path, pool)
     if not message_tables:
         print("  未找到消息表")
         return []
@@ -65,60 +171,69 @@ def extract_messages_from_db(db_path):
     print(f"  找到消息表: {message_tables}")
     
     all_messages = []
+    conn = pool.get(db_path)
     
-    for table in message_tables:
-        try:
-            # 获取表结构
-            results, columns = query_database(db_path, f"SELECT * FROM {table} LIMIT 1")
-            if not results:
-                continue
-            
-            print(f"    表 {table} 的列: {columns}")
-            
-            # 查找可能包含联系人名称的列
-            contact_col = None
-            content_col = None
-            time_col = None
-            
-            for col in columns:
-                col_lower = col.lower()
-                if any(x in col_lower for x in ['contact', 'user', 'name', 'talker', 'username']):
-                    contact_col = col
-                if any(x in col_lower for x in ['content', 'text', 'msg', 'message']):
-                    content_col = col
-                if any(x in col_lower for x in ['time', 'timestamp', 'create_time', 'date']):
-                    time_col = col
-            
-            # 查询所有记录
-            if content_col:
-                query = f"SELECT * FROM {table}"
+    try:
+        for table in message_tables:
+            try:
+                columns, contact_col, content_col, time_col = detect_columns(conn, table)
+                print(f"    表 {table} 的列: {columns}")
+                if not content_col:
+                    continue
+                
+                # 内容必须是长度超过 5 的文本，并且包含目标联系人或关键词
+                content_sql = quote_identifier(content_col)
+                conditions = [f"typeof({content_sql}) = 'text'", f"length({content_sql}) > 5",
+                              "(" + " OR ".join(f"instr({content_sql}, ?) > 0" for _ in CONTENT_KEYWORDS) + ")"]
+                params = list(CONTENT_KEYWORDS)
                 if contact_col:
-                    query += f" WHERE {contact_col} LIKE '%{TARGET_CONTACT}%'"
-                query += " LIMIT 10000"
+                    conditions.append(f"{quote_identifier(contact_col)} LIKE ?")
+                    params.append(f"%{TARGET_CONTACT}%")
+                if time_col and (start_date or end_date):
+                    # 秒级（< MS_TIMESTAMP_MIN）和毫秒级（>= MS_TIMESTAMP_MIN）时间戳分别比较，两种都接受
+                    time_sql = quote_identifier(time_col)
+                    conditions.append(f"(({time_sql} >= ? AND {time_sql} < ?) OR ({time_sql} >= ? AND {time_sql} < ?))")
+                    params.extend(date_range_params(start_date, end_date))
                 
-                results, _ = query_database(db_path, query)
-                if results:
-                    print(f"      找到 {len(results)} 条记录")
-                    for row in results:
-                        row_dict = dict(zip(columns, row))
-                        content = row_dict.get(content_col, '')
-                        if content and len(str(content)) > 5:
-                            # 检查是否包含目标联系人
-                            if TARGET_CONTACT in str(content) or any(x in str(content) for x in ["您", "我", "数学", "物理", "化学"]):
-                                msg = {
-                                    'content': str(content),
-                                    'table': table,
-                                    'timestamp': row_dict.get(time_col, datetime.now().timestamp() * 1000) if time_col else None,
-                                    'sender': row_dict.get(contact_col, '未知') if contact_col else '未知'
-                                }
-                                all_messages.append(msg)
-        except Exception as e:
-            print(f"    处理表 {table} 时出错: {e}")
+                select_cols = [content_col, time_col or content_col, contact_col or content_col]
+                # 时间列没有索引时按 rowid（表的存储顺序）分页，避免每页都排序整张表
+                key_col = time_col if time_col and time_indexed(conn, table, time_col) else None
+                rows = iter_keyset_pages(conn, table, select_cols, " AND ".join(conditions), params,
+                                         key_col, has_rowid(conn, table))
+                count = 0
+                for content, timestamp, sender in rows:
+                    all_messages.append({
+                        'content': content,
+                        'table': table,
+                        'timestamp': timestamp if time_col else None,
+                        'sender': sender if contact_col else '未知'
+                    })
+                    count += 1
+                if count:
+                    print(f"      找到 {count} 条记录")
+            except Exception as e:
+                print(f"    处理表 {table} 时出错: {e}")
+    finally:
+        # 一个数据库提取完就不再使用，关闭连接释放缓存
+        pool.release(db_path)
     
     return all_messages
 
 def main():
     """主函数"""
+    arg_parser = argparse.ArgumentParser(description="从SQLite数据库提取微信聊天记录")
+    arg_parser.add_argument("--dedup-on-disk", action="store_true",
+                            help="去重用的消息摘要保存在磁盘临时文件中（聊天记录特别大时使用）")
+    arg_parser.add_argument("--start-date", default=None,
+                            help="只提取该日期（YYYY-MM-DD）及以后的消息，默认不限制")
+    arg_parser.add_argument("--end-date", default=None,
+                            help="只提取该日期（YYYY-MM-DD，含当天）及以前的消息，默认不限制")
+    arg_parser.add_argument("--immutable", action="store_true",
+                            help="数据库是不会再变化的副本时加上（按 immutable 方式打开，不加锁，读取更快）；"
+                                 "默认按普通只读方式打开，因为 WECHAT_DATA 是微信正在使用的目录，"
+                                 "微信可能在读取过程中合并 WAL 并改写数据库")
+    args = arg_parser.parse_args()
+    
     print("=" * 60)
     print("从SQLite数据库提取微信聊天记录")
     print("=" * 60)
@@ -131,24 +246,19 @@ def main():
     db_files = list(WECHAT_DATA.rglob("*.db"))
     print(f"\n找到 {len(db_files)} 个数据库文件")
     
-    all_messages = []
-    
-    for db_path in db_files:
-        messages = extract_messages_from_db(db_path)
-        all_messages.extend(messages)
-    
-    print(f"\n总共提取了 {len(all_messages)} 条消息")
-    
-    # 去重
     unique_messages = []
-    seen = set()
-    for msg in all_messages:
-        content = msg['content']
-        if content and content not in seen:
-            seen.add(content)
-            unique_messages.append(msg)
+    total = 0
     
-    print(f"去重后: {len(unique_messages)} 条消息")
+    # 每个数据库提取完立即去重
+    with MessageDeduplicator(on_disk=args.dedup_on_disk) as dedup, \
+            ConnectionPool(immutable=args.immutable) as pool:
+        for db_path in db_files:
+            messages = extract_messages_from_db(db_path, args.start_date, args.end_date, pool)
+            total += len(messages)
+            unique_messages.extend(dedup.unique(messages))
+        
+        print(f"\n总共提取了 {total} 条消息")
+        print(f"去重后: {len(unique_messages)} 条消息（{dedup.summary()}）")
     
     # 写入文件
     output_file = OUTPUT_DIR / "wechat_sqlite_extracted.txt"
@@ -157,7 +267,7 @@ def main():
             timestamp = msg.get('timestamp')
             if timestamp:
                 try:
-                    if timestamp > 1e12:  # 毫秒时间戳
+                    if timestamp >= MS_TIMESTAMP_MIN:  # 毫秒时间戳
                         dt = datetime.fromtimestamp(timestamp / 1000)
                     else:  # 秒时间戳
                         dt = datetime.fromtimestamp(timestamp)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片缩放与重新压缩
+为图片清单中的每张图片生成限制尺寸的 WebP/JPEG 版本和缩略图，文档中链接缩放后的版本，
+避免把几MB的手机截图直接给读者。多张图片在进程池中并行处理；
+结果按图片内容的哈希和处理参数命名，已经生成过的直接跳过，重复运行不需要重新处理。
+
+需要 Pillow（pip install Pillow）；没有安装时跳过这一步，文档继续链接原图。
+
+使用方法：
+    py scripts/image_renditions.py --max-edge 1600 --quality 80
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 是可选依赖
+    Image = ImageOps = None
+
+from image_store import ImageStore
+
+MAX_EDGE = 1600     # 缩放后长边的最大像素数
+THUMB_EDGE = 320    # 缩略图长边的最大像素数
+QUALITY = 80        # 有损压缩质量（1-100）
+
+# 输出格式 -> (Pillow 格式名, 扩展名)
+RENDITION_FORMATS = {'webp': ('WEBP', '.webp'), 'jpeg': ('JPEG', '.jpg')}
+
+# 处理任务：(原图路径, [(输出路径, 长边像素)], 质量, Pillow 格式名)
+RenderTask = Tuple[str, List[Tuple[str, int]], int, str]
+
+
+def _render_image(task: RenderTask) -> Optional[str]:
+    """在子进程中生成一张图片的各个尺寸，成功返回 None，失败返回错误信息"""
+    source, targets, quality, pil_format = task
+    try:
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                img = img.convert('RGBA')
+            for path, edge in targets:
+                resized = img.copy()
+                resized.thumbnail((edge, edge), Image.LANCZOS)
+                # 先写临时文件再改名，中断时不会留下不完整的文件
+                tmp_path = path + '.tmp'
+                resized.save(tmp_path, pil_format, quality=quality)
+                os.replace(tmp_path, path)
+    except Exception as e:
+        return f"{Path(source).name}: {e}"
+    return None
+
+
+def build_renditions(store: ImageStore, max_edge: int = MAX_EDGE, thumb_edge: int = THUMB_EDGE,
+                     quality: int = QUALITY, fmt: str = 'webp', workers: Optional[int] = None) -> int:
+    """为清单中的图片生成缩放版本和缩略图，记录到清单中，返回本次新处理的图片数
+
+    调用方负责 store.save()。没有安装 Pillow 时什么也不做。
+    """
+    if Image is None:
+        print("  未安装 Pillow（pip install Pillow），跳过缩放，文档继续链接原图")
+        return 0
+
+    pil_format, ext = RENDITION_FORMATS[fmt]
+    renditions: Dict[str, Tuple[str, str]] = {}  # sha256 -> (缩放版本, 缩略图)
+    tasks: List[RenderTask] = []
+    task_hashes: List[str] = []
+    for entry in store.entries():
+        sha256 = entry['sha256']
+        if sha256 in renditions:
+            continue
+        names = (f"{sha256}_{max_edge}q{quality}{ext}", f"{sha256}_{thumb_edge}q{quality}{ext}")
+        renditions[sha256] = names
+        targets = [(str(store.root / name), edge)
+                   for name, edge in zip(names, (max_edge, thumb_edge))
+                   if not (store.root / name).exists()]
+        if targets:
+            tasks.append((str(store.root / entry['file']), targets, quality, pil_format))
+            task_hashes.append(sha256)
+
+    print(f"  {len(renditions)} 张图片，已缓存 {len(renditions) - len(tasks)} 张，需要处理 {len(tasks)} 张")
+    processed = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for sha256, error in zip(task_hashes, executor.map(_render_image, tasks)):
+                if error:
+                    print(f"  处理失败 {error}")
+                    del renditions[sha256]
+                else:
+                    processed += 1
+
+    for sha256, (rendition, thumbnail) in renditions.items():
+        store.set_renditions(sha256, rendition, thumbnail)
+    return processed
+
+
+def add_rendition_arguments(parser: argparse.ArgumentParser):
+    """添加缩放相关的命令行参数"""
+    parser.add_argument("--max-edge", type=int, default=MAX_EDGE, help="缩放后长边的最大像素数")
+    parser.add_argument("--thumb-edge", type=int, default=THUMB_EDGE, help="缩略图长边的最大像素数")
+    parser.add_argument("--quality", type=int, default=QUALITY, help="压缩质量（1-100）")
+    parser.add_argument("--format", choices=sorted(RENDITION_FORMATS), default='webp', help="输出格式")
+    parser.add_argument("--workers", type=int, default=None, help="并行处理的进程数（默认为CPU核数）")
+
+
+def main():
+    """主函数"""
+    from extract_images_from_email import CDN_DIR
+
+    parser = argparse.ArgumentParser(description="为已提取的图片生成缩放版本和缩略图")
+    add_rendition_arguments(parser)
+    args = parser.parse_args()
+
+    store = ImageStore(CDN_DIR)
+    build_renditions(store, args.max_edge, args.thumb_edge, args.quality, args.format, args.workers)
+    store.save()
+    print(f"清单已更新: {store.manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的图片仓库
+图片以内容的 SHA-256 命名保存到CDN仓库目录，同样的图片只写一次，重复运行不会重写；
+清单（assets/images/image_manifest.json）记录聊天记录中的图片编号对应哪张图片，
+生成学习总结时直接用清单把“图片N（可在附件中查看）”换成CDN链接，不需要重新解析邮件。
+"""
+
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from email_ingest import IMAGE_EXTENSIONS
+
+PROJECT_ROOT = Path(__file__).parent.parent
+IMAGE_MANIFEST = PROJECT_ROOT / "assets" / "images" / "image_manifest.json"
+CDN_URL_BASE = "https://cdn.jsdelivr.net/gh/dadongshangu/CDN@master/qiuxuan/"
+MANIFEST_VERSION = 1
+
+# 聊天记录中的图片引用（生成文档时拼接的引用带有方括号，替换时一并去掉）
+IMAGE_REF = re.compile(r'\[图片(\d+)（可在附件中查看）\]|图片(\d+)（可在附件中查看）')
+
+
+def image_extension(filename: str, content_type: str = '') -> str:
+    """根据文件名或 Content-Type 确定图片扩展名"""
+    ext = Path(filename or '').suffix.lower()
+    if ext in IMAGE_EXTENSIONS:
+        return ext
+    if 'png' in content_type:
+        return '.png'
+    if 'gif' in content_type:
+        return '.gif'
+    return '.jpg'
+
+
+class ImageStore:
+    """CDN仓库目录中按内容寻址的图片，以及图片编号 -> 图片的清单"""
+
+    def __init__(self, root: Path, manifest_path: Path = IMAGE_MANIFEST):
+        self.root = Path(root)
+        self.manifest_path = Path(manifest_path)
+        # 图片编号 -> {'file', 'sha256', 'source'}，生成缩放版本后还有 'rendition'、'thumbnail'
+        self.references: Dict[str, Dict[str, str]] = {}
+        self.unmapped: Dict[str, Dict[str, str]] = {}    # 没有对应编号的图片：文件名 -> 同上
+        self.written = 0
+        self.skipped = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == MANIFEST_VERSION:
+            self.references = data.get('references', {})
+            self.unmapped = data.get('unmapped', {})
+
+    def save(self):
+        """保存清单"""
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'url_base': CDN_URL_BASE,
+                       'references': self.references, 'unmapped': self.unmapped},
+                      f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    def put(self, image: Dict) -> Dict[str, str]:
+        """保存一张图片（已有同样内容的文件时跳过），返回清单条目"""
+        sha256 = hashlib.sha256(image['data']).hexdigest()
+        filename = sha256 + image_extension(image.get('filename'), image.get('content_type', ''))
+        path = self.root / filename
+        if path.exists() and path.stat().st_size == len(image['data']):
+            self.skipped += 1
+        else:
+            # 先写临时文件再改名，中断时不会留下不完整的图片
+            tmp_path = path.with_suffix(path.suffix + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(image['data'])
+            tmp_path.replace(path)
+            self.written += 1
+        return {'file': filename, 'sha256': sha256, 'source': image.get('filename', '')}
+
+    def assign(self, ref_num: int, image: Dict) -> Dict[str, str]:
+        """保存图片，并把它记为聊天记录中的“图片{ref_num}”"""
+        entry = self.put(image)
+        key = str(ref_num)
+        self.references[key] = _keep_renditions(entry, self.references.get(key))
+        return self.references[key]
+
+    def add_unmapped(self, image: Dict) -> Dict[str, str]:
+        """保存没有对应编号的图片"""
+        entry = self.put(image)
+        self.unmapped[entry['file']] = _keep_renditions(entry, self.unmapped.get(entry['file']))
+        return self.unmapped[entry['file']]
+
+    def entries(self) -> List[Dict[str, str]]:
+        """清单中的所有条目（有编号的和未映射的）"""
+        return list(self.references.values()) + list(self.unmapped.values())
+
+    def set_renditions(self, sha256: str, rendition: str, thumbnail: str):
+        """记录某张图片的缩放版本和缩略图（见 image_renditions.py）"""
+        for entry in self.entries():
+            if entry['sha256'] == sha256:
+                entry['rendition'] = rendition
+                entry['thumbnail'] = thumbnail
+
+
+def _keep_renditions(entry: Dict[str, str], previous: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """图片内容没变时，保留清单中原条目已生成的缩放版本和缩略图"""
+    if previous and previous.get('sha256') == entry['sha256']:
+        for key in ('rendition', 'thumbnail'):
+            if key in previous:
+                entry[key] = previous[key]
+    return entry
+
+
+def load_reference_urls(manifest_path: Path = IMAGE_MANIFEST) -> Dict[int, str]:
+    """读取清单，返回 图片编号 -> CDN链接（有缩放版本时链接缩放版本）；没有清单时返回空字典"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != MANIFEST_VERSION:
+        return {}
+    url_base = data.get('url_base', CDN_URL_BASE)
+    return {int(num): url_base + entry.get('rendition', entry['file'])
+            for num, entry in data.get('references', {}).items()}
+
+
+def link_image_refs(text: str, urls: Dict[int, str]) -> str:
+    """把文本中清单里有的“图片N（可在附件中查看）”替换为 Markdown 图片链接"""
+    if not urls or '图片' not in text:
+        return text
+
+    def replace(match):
+        num = match.group(1) or match.group(2)
+        url: Optional[str] = urls.get(int(num))
+        return f"![图片{num}]({url})" if url else match.group(0)
+
+    return IMAGE_REF.sub(replace, text)
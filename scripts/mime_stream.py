@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式解析MIME邮件
+逐行读取 .eml 文件，用 BytesFeedParser 解析每个部分的头部，
+正文按传输编码（base64 / quoted-printable）边读边解码，直接写入调用方提供的输出，
+不会把整封邮件或整个附件放进内存。
+"""
+
+import binascii
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesFeedParser
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+# 处理函数：根据部分的头部和嵌套深度返回一个可写对象（有 write 方法），返回 None 表示跳过该部分
+PartHandler = Callable[[EmailMessage, int], Optional[object]]
+
+# 读到的分隔行：(边界, 是否为结束边界)
+Delimiter = Optional[Tuple[bytes, bool]]
+
+
+class _Base64Decoder:
+    """增量 base64 解码，不足4个字符的部分留到下一行"""
+    def __init__(self):
+        self.pending = b""
+
+    def feed(self, line: bytes, last: bool = False) -> bytes:
+        data = self.pending + b"".join(line.split())
+        usable = len(data) // 4 * 4
+        self.pending = data[usable:]
+        try:
+            return binascii.a2b_base64(data[:usable]) if usable else b""
+        except binascii.Error:
+            return b""
+
+
+class _QuotedPrintableDecoder:
+    """逐行 quoted-printable 解码（行尾的 = 为软换行）"""
+    def feed(self, line: bytes, last: bool = False) -> bytes:
+        if last:
+            line = line.rstrip(b"\r\n")
+        return binascii.a2b_qp(line)
+
+
+class _RawDecoder:
+    """7bit / 8bit / binary：原样输出，分隔行前的换行属于分隔符"""
+    def feed(self, line: bytes, last: bool = False) -> bytes:
+        return line.rstrip(b"\r\n") if last else line
+
+
+def _decoder_for(headers: EmailMessage):
+    encoding = str(headers.get("Content-Transfer-Encoding", "")).strip().lower()
+    if encoding == "base64":
+        return _Base64Decoder()
+    if encoding == "quoted-printable":
+        return _QuotedPrintableDecoder()
+    return _RawDecoder()
+
+
+def _match_delimiter(line: bytes, boundaries: List[bytes]) -> Delimiter:
+    """判断一行是否为某个外层边界的分隔行"""
+    if not line.startswith(b"--"):
+        return None
+    stripped = line.rstrip()
+    for boundary in reversed(boundaries):
+        if stripped == b"--" + boundary:
+            return boundary, False
+        if stripped == b"--" + boundary + b"--":
+            return boundary, True
+    return None
+
+
+def _read_headers(lines: Iterator[bytes]) -> EmailMessage:
+    """读取一个部分的头部（到第一个空行为止）"""
+    parser = BytesFeedParser(policy=policy.default)
+    for line in lines:
+        parser.feed(line)
+        if line in (b"\r\n", b"\n"):
+            break
+    return parser.close()
+
+
+def _skip_to_delimiter(lines: Iterator[bytes], boundaries: List[bytes]) -> Delimiter:
+    """跳过前言/结语，直到下一个分隔行"""
+    for line in lines:
+        delimiter = _match_delimiter(line, boundaries)
+        if delimiter:
+            return delimiter
+    return None
+
+
+def _read_body(lines: Iterator[bytes], boundaries: List[bytes], decoder, sink) -> Delimiter:
+    """读取正文直到分隔行，解码后写入 sink（sink 为 None 时丢弃）"""
+    previous = None
+    delimiter = None
+    for line in lines:
+        delimiter = _match_delimiter(line, boundaries)
+        if delimiter:
+            break
+        if previous is not None and sink is not None:
+            sink.write(decoder.feed(previous))
+        previous = line
+    if previous is not None and sink is not None:
+        # 分隔行前的换行属于分隔符；读到文件末尾时则保留
+        sink.write(decoder.feed(previous, last=delimiter is not None))
+    return delimiter
+
+
+def _parse_entity(lines: Iterator[bytes], boundaries: List[bytes],
+                  handler: PartHandler, depth: int) -> Delimiter:
+    headers = _read_headers(lines)
+    if headers.get_content_type() == "message/rfc822" and isinstance(_decoder_for(headers), _RawDecoder):
+        # 转发的邮件：正文本身是一封完整的邮件，继续解析其中的各个部分
+        return _parse_entity(lines, boundaries, handler, depth + 1)
+    boundary = headers.get_boundary() if headers.get_content_maintype() == "multipart" else None
+    if not boundary:
+        return _read_body(lines, boundaries, _decoder_for(headers), handler(headers, depth))
+
+    boundary = boundary.encode("ascii", errors="ignore")
+    boundaries.append(boundary)
+    delimiter = _skip_to_delimiter(lines, boundaries)
+    while delimiter == (boundary, False):
+        delimiter = _parse_entity(lines, boundaries, handler, depth + 1)
+    boundaries.pop()
+    if delimiter == (boundary, True):
+        # 本层结束，跳过结语，直到外层的分隔行
+        delimiter = _skip_to_delimiter(lines, boundaries)
+    return delimiter
+
+
+def stream_mime_parts(file: BinaryIO, handler: PartHandler):
+    """流式遍历邮件的所有非 multipart 部分（包括转发的 message/rfc822 邮件中的部分）
+
+    对每个部分调用 handler(头部, 嵌套深度)；handler 返回可写对象时，
+    解码后的正文分块写入该对象，返回 None 时跳过正文。
+    """
+    _parse_entity(iter(file), [], handler, 0)
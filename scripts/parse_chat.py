@@ -8,18 +8,36 @@
 import os
 import re
 import json
+import hashlib
+import argparse
+import sqlite3
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Iterator, Union
 import html
 from html.parser import HTMLParser
 
+from image_store import link_image_refs, load_reference_urls
+from timeline import TimelineView, date_range, format_epoch, parse_epoch
+
 # 项目根目录
 PROJECT_ROOT = Path(__file__).parent.parent
 CHAT_DIR = PROJECT_ROOT / "assets" / "chat"
 IMAGES_DIR = PROJECT_ROOT / "assets" / "images"
 DOCS_DIR = PROJECT_ROOT / "docs"
 CLASS_RECORDS_DIR = DOCS_DIR / "class_records"
+# 增量生成时记录每份文档输入摘要的清单（只保存在本地）
+REPORT_MANIFEST = CHAT_DIR / ".report_manifest.json"
+# 文档模板版本，修改生成格式时递增，使清单中的摘要全部失效
+REPORT_FORMAT_VERSION = 1
+# 已解析消息的本地缓存（按文件指纹复用，只保存在本地）
+PARSE_CACHE = CHAT_DIR / ".parse_cache.sqlite"
+# 解析缓存版本，修改 ChatParser 的解析结果或缓存表结构时递增，使缓存全部失效
+PARSE_CACHE_VERSION = 1
 
 # 学科关键词
 SUBJECT_KEYWORDS = {
@@ -34,9 +52,41 @@ QUESTION_KEYWORDS = [
     "帮我", "讲题", "讲讲", "看看", "不会", "不懂", "不明白"
 ]
 
+# 学生请求帮助的关键词
+HELP_KEYWORDS = [
+    "帮我", "讲题", "讲讲", "看看", "不会", "不懂", "不明白",
+    "怎么做", "怎么", "如何", "什么", "为什么", "？", "?"
+]
+
+# 文本格式识别
+# 格式1: 2025-09-01 10:30:15 发送者 消息内容
+# 格式2: [2025-09-01 10:30:15] 发送者: 消息内容
+TEXT_FORMAT_1 = re.compile(r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})\s+(\S+)(?:\s+(.*?))?\s*$')
+TEXT_FORMAT_2 = re.compile(r'\[(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})\]\s+([^:]+):(?:\s+(.*?))?\s*$')
+TEXT_FORMAT_SNIFF_SIZE = 8192  # 用于识别格式的文件开头字符数
+
+# 在提问之后多少条消息以内查找学生的回答
+ANSWER_WINDOW = 4
+
+# 图片消息向前/向后多少条消息以内查找要关联的问题
+IMAGE_BACK_WINDOW = 5
+IMAGE_FORWARD_WINDOW = 3
+
+
+def _detect_text_format(head: str):
+    """根据文件开头的内容判断文本格式，返回对应的行匹配模式（默认格式1）"""
+    lines = head.splitlines()
+    if any(TEXT_FORMAT_1.match(line) for line in lines):
+        return TEXT_FORMAT_1
+    if any(TEXT_FORMAT_2.match(line) for line in lines):
+        return TEXT_FORMAT_2
+    return TEXT_FORMAT_1
+
 
 class ChatMessage:
     """聊天消息类"""
+    __slots__ = ('timestamp', 'sender', 'content', 'images', 'is_question', 'subject')
+    
     def __init__(self, timestamp: str, sender: str, content: str, images: List[str] = None):
         self.timestamp = timestamp
         self.sender = sender
@@ -44,6 +94,11 @@ class ChatMessage:
         self.images = images or []
         self.is_question = False
         self.subject = None
+    
+    @property
+    def display_content(self) -> str:
+        """用于生成文档的内容"""
+        return self.content
         
     def analyze(self, teacher_name: str = "您", student_name: str = "秋璇"):
         """分析消息，判断是否为提问，识别学科"""
@@ -59,9 +114,7 @@ class ChatMessage:
         # 学生请求帮助（也应该识别为问题）
         if self.sender in student_names or any(name in self.sender for name in student_names):
             # 检查是否包含请求帮助的关键词
-            help_keywords = ["帮我", "讲题", "讲讲", "看看", "不会", "不懂", "不明白", 
-                           "怎么做", "怎么", "如何", "什么", "为什么", "？", "?"]
-            if any(keyword in self.content for keyword in help_keywords):
+            if any(keyword in self.content for keyword in HELP_KEYWORDS):
                 self.is_question = True
         
         # 识别学科
@@ -73,42 +126,480 @@ class ChatMessage:
         return self.is_question, self.subject
 
 
+class StoredMessage:
+    """MessageStore 中一条消息的轻量视图
+    
+    属性与 ChatMessage 相同（timestamp、sender、content、images、is_question、subject），
+    读写都直接作用于所属的 MessageStore，按需创建，不复制消息数据。
+    """
+    __slots__ = ('_store', '_index')
+    
+    def __init__(self, store: 'MessageStore', index: int):
+        self._store = store
+        self._index = index
+    
+    @property
+    def timestamp(self) -> str:
+        return self._store._timestamp(self._index)
+    
+    @property
+    def sender(self) -> str:
+        return self._store._senders[self._store._sender_ids[self._index]]
+    
+    @property
+    def content(self) -> str:
+        return self._store._content(self._index)
+    
+    @content.setter
+    def content(self, value: str):
+        self._store._edited_contents[self._index] = value
+    
+    @property
+    def display_content(self) -> str:
+        """用于生成文档的内容（拼接了关联的图片引用）"""
+        return self._store._display_content(self._index)
+    
+    @property
+    def images(self) -> List[str]:
+        """图片引用（只读，添加图片用 MessageStore.attach_image）"""
+        return self._store._images.get(self._index, [])
+    
+    @images.setter
+    def images(self, value: List[str]):
+        self._store._images[self._index] = value
+    
+    @property
+    def is_question(self) -> bool:
+        return bool(self._store._flags[self._index] & 1)
+    
+    @is_question.setter
+    def is_question(self, value: bool):
+        flags = self._store._flags
+        flags[self._index] = (flags[self._index] & ~1) | int(bool(value))
+    
+    @property
+    def subject(self) -> Optional[str]:
+        subject_id = self._store._flags[self._index] >> 1
+        return self._store.subjects[subject_id - 1] if subject_id else None
+    
+    @subject.setter
+    def subject(self, value: Optional[str]):
+        flags = self._store._flags
+        subject_id = self._store.subjects.index(value) + 1 if value else 0
+        flags[self._index] = (flags[self._index] & 1) | (subject_id << 1)
+    
+    def __eq__(self, other):
+        return (isinstance(other, StoredMessage)
+                and self._store is other._store and self._index == other._index)
+    
+    def __hash__(self):
+        return hash((id(self._store), self._index))
+    
+    def __repr__(self):
+        return f"StoredMessage({self.timestamp!r}, {self.sender!r}, {self.content[:20]!r})"
+
+
+class MessageStore:
+    """紧凑的列式消息存储
+    
+    各字段按列保存：发送者去重后存编号，时间存秒级时间戳 array('q')，
+    提问/学科标记存 bytearray（第0位为提问，其余位为学科序号+1），
+    内容拼接到一个共享缓冲区中只记录起止位置。图片和被修改过的内容较少，单独用字典保存。
+    通过下标或迭代得到 StoredMessage 视图，用法与 List[ChatMessage] 相同。
+    """
+    
+    def __init__(self, subjects: Tuple[str, ...] = tuple(SUBJECT_KEYWORDS)):
+        self.subjects = subjects
+        self._senders: List[str] = []
+        self._sender_index: Dict[str, int] = {}
+        self._sender_ids = array('I')
+        self._timestamps = array('q')
+        self._flags = bytearray()
+        self._offsets = array('q')
+        self._lengths = array('q')
+        self._buffer = ""
+        self._pending: List[str] = []   # 尚未合并进缓冲区的内容
+        self._size = 0                  # 缓冲区（含待合并部分）的总长度
+        self._raw_timestamps: Dict[int, str] = {}   # 无法无损转换为时间戳的原始时间
+        self._images: Dict[int, List[str]] = {}
+        self._edited_contents: Dict[int, str] = {}
+        self._image_notes: Dict[int, List[Tuple[str, bool]]] = {}  # 生成文档时拼接到内容中的图片引用
+        self._sorted = True
+    
+    def append(self, msg: ChatMessage):
+        """追加一条消息"""
+        index = len(self._timestamps)
+        
+        sender_id = self._sender_index.get(msg.sender)
+        if sender_id is None:
+            sender_id = len(self._senders)
+            self._senders.append(msg.sender)
+            self._sender_index[msg.sender] = sender_id
+        self._sender_ids.append(sender_id)
+        
+        epoch = parse_epoch(msg.timestamp)
+        if epoch is None or format_epoch(epoch) != msg.timestamp:
+            self._raw_timestamps[index] = msg.timestamp
+        if epoch is None:
+            epoch = -1
+        if index and epoch < self._timestamps[-1]:
+            self._sorted = False
+        self._timestamps.append(epoch)
+        
+        subject_id = self.subjects.index(msg.subject) + 1 if msg.subject else 0
+        self._flags.append(int(msg.is_question) | (subject_id << 1))
+        
+        content = msg.content or ""
+        self._offsets.append(self._size)
+        self._lengths.append(len(content))
+        self._pending.append(content)
+        self._size += len(content)
+        
+        if msg.images:
+            self._images[index] = list(msg.images)
+    
+    def extend(self, messages):
+        for msg in messages:
+            self.append(msg)
+    
+    def sort_by_time(self):
+        """按时间戳稳定排序（无法识别时间的消息排在最前）"""
+        timestamps = self._timestamps
+        if self._sorted:
+            return
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        new_index = {old: new for new, old in enumerate(order)}
+        
+        self._sender_ids = array('I', (self._sender_ids[i] for i in order))
+        self._timestamps = array('q', (timestamps[i] for i in order))
+        self._flags = bytearray(self._flags[i] for i in order)
+        self._offsets = array('q', (self._offsets[i] for i in order))
+        self._lengths = array('q', (self._lengths[i] for i in order))
+        for name in ('_raw_timestamps', '_images', '_edited_contents', '_image_notes'):
+            column = getattr(self, name)
+            setattr(self, name, {new_index[i]: value for i, value in column.items()})
+        self._sorted = True
+    
+    def between(self, start_date: str, end_date: str) -> TimelineView:
+        """返回 [start_date, end_date] 之间（含两端日期）的消息视图
+        
+        在时间戳列上二分查找，O(log n)，不复制消息；无法识别时间的消息不包含在内。
+        """
+        self.sort_by_time()
+        lo, hi = date_range(self._timestamps, start_date, end_date)
+        return TimelineView(self, lo, hi)
+    
+    def has_images(self, index: int) -> bool:
+        return bool(self._images.get(index))
+    
+    def attach_image(self, index: int, image_ref: str, before: bool):
+        """把图片引用关联到一条消息；生成文档时拼接到内容前面（before）或后面"""
+        self._images.setdefault(index, []).append(image_ref)
+        self._image_notes.setdefault(index, []).append((image_ref, before))
+    
+    def _display_content(self, index: int) -> str:
+        content = self._content(index)
+        for image_ref, before in self._image_notes.get(index, ()):
+            # 内容里已经有这个引用时不再重复添加
+            if image_ref not in content:
+                content = f"[{image_ref}]\n{content}" if before else f"{content}\n[{image_ref}]"
+        return content
+    
+    def _timestamp(self, index: int) -> str:
+        raw = self._raw_timestamps.get(index)
+        if raw is not None:
+            return raw
+        return format_epoch(self._timestamps[index])
+    
+    def _content(self, index: int) -> str:
+        edited = self._edited_contents.get(index)
+        if edited is not None:
+            return edited
+        if self._pending:
+            self._buffer += "".join(self._pending)
+            self._pending = []
+        offset = self._offsets[index]
+        return self._buffer[offset:offset + self._lengths[index]]
+    
+    def __len__(self) -> int:
+        return len(self._timestamps)
+    
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [StoredMessage(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("MessageStore index out of range")
+        return StoredMessage(self, index)
+    
+    def __iter__(self) -> Iterator[StoredMessage]:
+        for i in range(len(self)):
+            yield StoredMessage(self, i)
+
+
+class MessageClassifier:
+    """消息分类器
+    
+    构造时把提问、求助和各学科关键词编译成一个正则，每条消息只需扫描一遍内容，
+    结果与 ChatMessage.analyze 一致；发送者的老师/学生身份判断按发送者缓存。
+    """
+    QUESTION = 1  # 老师提问关键词
+    HELP = 2      # 学生求助关键词
+    
+    def __init__(self, teacher_name: str = "您", student_name: str = "秋璇"):
+        self.teacher_names = (teacher_name, "您", "孟祥志", "四叔")
+        self.student_names = (student_name, "秋璇", "孟秋璇", "学生")
+        self.subjects = tuple(SUBJECT_KEYWORDS)
+        
+        # 每个关键词对应一组类别位：提问、求助、以及各学科（从第3位开始）
+        categories: Dict[str, int] = {}
+        for keyword in QUESTION_KEYWORDS:
+            categories[keyword] = categories.get(keyword, 0) | self.QUESTION
+        for keyword in HELP_KEYWORDS:
+            categories[keyword] = categories.get(keyword, 0) | self.HELP
+        for i, subject in enumerate(self.subjects):
+            for keyword in SUBJECT_KEYWORDS[subject]:
+                categories[keyword] = categories.get(keyword, 0) | (4 << i)
+        
+        # 正则按"长关键词优先、不重叠"的方式匹配，为保证与逐个 in 判断的结果一致：
+        # 1. 命中的关键词还要算上它包含的较短关键词的类别（如"怎么做"包含"怎么"）
+        # 2. 与其他关键词首尾重叠时会漏掉后一个（如"化合物"与"物理"），
+        #    因此把会带来新类别的重叠组合（"化合物理"）也加入关键词
+        def contained(text: str) -> int:
+            return self._merge(mask for keyword, mask in categories.items() if keyword in text)
+        
+        self._categories = {keyword: contained(keyword) for keyword in categories}
+        pending = list(self._categories)
+        while pending:
+            first = pending.pop()
+            for second in categories:
+                for overlap in range(1, min(len(first), len(second))):
+                    if first[-overlap:] != second[:overlap]:
+                        continue
+                    combined = first + second[overlap:]
+                    mask = contained(combined)
+                    if combined not in self._categories and mask != self._categories[first]:
+                        self._categories[combined] = mask
+                        pending.append(combined)
+        
+        alternation = '|'.join(re.escape(k) for k in sorted(self._categories, key=len, reverse=True))
+        self._pattern = re.compile(alternation)
+        self._roles: Dict[str, Tuple[bool, bool]] = {}
+        
+        # 关键词表和名称的指纹，任何一项变化时缓存的分析结果都需要重新计算
+        self.fingerprint = hashlib.sha256(json.dumps(
+            [SUBJECT_KEYWORDS, QUESTION_KEYWORDS, HELP_KEYWORDS, self.teacher_names, self.student_names],
+            ensure_ascii=False).encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _merge(bits) -> int:
+        mask = 0
+        for bit in bits:
+            mask |= bit
+        return mask
+    
+    def _role(self, sender: str) -> Tuple[bool, bool]:
+        """判断发送者是否为老师、学生（按发送者缓存）"""
+        role = self._roles.get(sender)
+        if role is None:
+            role = (any(name in sender for name in self.teacher_names),
+                    any(name in sender for name in self.student_names))
+            self._roles[sender] = role
+        return role
+    
+    def classify(self, sender: str, content: str) -> Tuple[bool, Optional[str]]:
+        """一次扫描内容，返回 (是否为提问, 学科)"""
+        categories = self._categories
+        mask = 0
+        for keyword in self._pattern.findall(content):
+            mask |= categories[keyword]
+        
+        is_teacher, is_student = self._role(sender)
+        is_question = bool((is_teacher and mask & self.QUESTION) or (is_student and mask & self.HELP))
+        
+        subject = None
+        subject_bits = mask >> 2
+        if subject_bits:
+            # 与 analyze 一致：按 SUBJECT_KEYWORDS 的顺序取第一个命中的学科
+            subject = self.subjects[(subject_bits & -subject_bits).bit_length() - 1]
+        return is_question, subject
+    
+    def analyze(self, msg: ChatMessage) -> Tuple[bool, Optional[str]]:
+        """分析消息并写回 is_question / subject，行为与 ChatMessage.analyze 相同"""
+        is_question, subject = self.classify(msg.sender, msg.content)
+        if is_question:
+            msg.is_question = True
+        if subject:
+            msg.subject = subject
+        return msg.is_question, msg.subject
+
+
+def _file_sha256(file_path: Path) -> str:
+    """分块计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """已解析消息的 SQLite 缓存
+    
+    按 (路径, 大小, 修改时间, 内容哈希) 判断文件是否变化：大小和修改时间相同直接命中，
+    否则再比较内容哈希。缓存中同时保存分析结果和分类器指纹，关键词表变化时只重新分析，
+    不需要重新解析文件。缓存版本（PRAGMA user_version）与 PARSE_CACHE_VERSION 不同时清空缓存；
+    已删除或改名的文件的缓存在每次运行后用 prune 清理。
+    """
+    def __init__(self, db_path: Optional[Path] = None):
+        self.conn = sqlite3.connect(str(db_path or PARSE_CACHE))
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != PARSE_CACHE_VERSION:
+            self.conn.executescript(f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS messages;
+                PRAGMA user_version = {PARSE_CACHE_VERSION};
+            """)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,
+                sha256 TEXT, classifier TEXT
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                path TEXT, seq INTEGER, timestamp, sender, content, images TEXT,
+                is_question INTEGER, subject TEXT,
+                PRIMARY KEY (path, seq)
+            );
+        """)
+    
+    def close(self):
+        self.conn.close()
+    
+    def prune(self, file_paths: List[Path]) -> int:
+        """删除不在 file_paths 中的文件（已删除或改名）的缓存，返回删除的文件数"""
+        keep = {str(f.resolve()) for f in file_paths}
+        stale = [(path,) for (path,) in self.conn.execute("SELECT path FROM files")
+                 if path not in keep]
+        if stale:
+            with self.conn:
+                self.conn.executemany("DELETE FROM messages WHERE path = ?", stale)
+                self.conn.executemany("DELETE FROM files WHERE path = ?", stale)
+        return len(stale)
+    
+    def load(self, file_path: Path, classifier: MessageClassifier) -> Optional[List[ChatMessage]]:
+        """读取文件的缓存消息，文件变化或没有缓存时返回 None"""
+        key = str(file_path.resolve())
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, sha256, classifier FROM files WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, sha256, fingerprint = row
+        
+        stat = file_path.stat()
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            if stat.st_size != size or _file_sha256(file_path) != sha256:
+                return None
+            # 内容没变，只是修改时间变了（如重新复制了一次）
+            self.conn.execute("UPDATE files SET mtime_ns = ? WHERE path = ?", (stat.st_mtime_ns, key))
+            self.conn.commit()
+        
+        messages = []
+        for timestamp, sender, content, images, is_question, subject in self.conn.execute(
+                "SELECT timestamp, sender, content, images, is_question, subject "
+                "FROM messages WHERE path = ? ORDER BY seq", (key,)):
+            msg = ChatMessage(timestamp, sender, content, json.loads(images) if images else None)
+            msg.is_question = bool(is_question)
+            msg.subject = subject
+            messages.append(msg)
+        
+        if fingerprint != classifier.fingerprint:
+            # 关键词表变化，重新分析并更新缓存
+            for msg in messages:
+                msg.is_question = False
+                msg.subject = None
+                classifier.analyze(msg)
+            self.save(file_path, messages, classifier, sha256)
+        return messages
+    
+    def save(self, file_path: Path, messages: List[ChatMessage], classifier: MessageClassifier,
+             sha256: Optional[str] = None):
+        """保存文件解析并分析后的消息"""
+        key = str(file_path.resolve())
+        stat = file_path.stat()
+        if sha256 is None:
+            sha256 = _file_sha256(file_path)
+        with self.conn:
+            self.conn.execute("DELETE FROM messages WHERE path = ?", (key,))
+            self.conn.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((key, seq, msg.timestamp, msg.sender, msg.content,
+                  json.dumps(msg.images, ensure_ascii=False) if msg.images else None,
+                  int(msg.is_question), msg.subject)
+                 for seq, msg in enumerate(messages)))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime_ns, sha256, classifier.fingerprint))
+
+
+def _time_key(msg: ChatMessage) -> int:
+    """消息排序用的秒级时间戳（与 MessageStore 一致，无法识别的时间排在最前）"""
+    epoch = parse_epoch(msg.timestamp)
+    return -1 if epoch is None else epoch
+
+
+# 进程池中每个工作进程复用的解析器
+_worker_parsers: Dict[Tuple[str, str], 'ChatParser'] = {}
+
+
+def _parse_and_analyze(file_path: Path, teacher_name: str, student_name: str) -> List[ChatMessage]:
+    """进程池任务：解析并分析单个文件"""
+    parser = _worker_parsers.get((teacher_name, student_name))
+    if parser is None:
+        parser = ChatParser(teacher_name, student_name)
+        _worker_parsers[(teacher_name, student_name)] = parser
+    return parser.parse_and_analyze(file_path)
+
+
 class ChatParser:
     """聊天记录解析器"""
     
     def __init__(self, teacher_name: str = "您", student_name: str = "秋璇"):
         self.teacher_name = teacher_name
         self.student_name = student_name
-        self.messages: List[ChatMessage] = []
+        self.classifier = MessageClassifier(teacher_name, student_name)
+        self.messages = MessageStore(self.classifier.subjects)
         
     def parse_text_file(self, file_path: Path) -> List[ChatMessage]:
         """解析文本格式的聊天记录"""
-        messages = []
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        return list(self.iter_text_file(file_path))
+    
+    def iter_text_file(self, file_path: Path) -> Iterator[ChatMessage]:
+        """逐行流式解析文本格式的聊天记录，逐条产出消息
         
-        # 尝试匹配常见的文本格式
-        # 格式1: 2025-09-01 10:30:15 发送者 消息内容
-        pattern1 = r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})\s+([^\s]+)\s+(.+?)(?=\d{4}-\d{2}-\d{2}|\Z)'
-        matches = re.findall(pattern1, content, re.DOTALL)
-        
-        for match in matches:
-            timestamp, sender, content = match
-            content = content.strip()
-            messages.append(ChatMessage(timestamp, sender, content))
-        
-        # 如果格式1没有匹配到，尝试其他格式
-        if not messages:
-            # 格式2: [2025-09-01 10:30:15] 发送者: 消息内容
-            pattern2 = r'\[(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2})\]\s+([^:]+):\s+(.+?)(?=\[\d{4}-\d{2}-\d{2}|\Z)'
-            matches = re.findall(pattern2, content, re.DOTALL)
+        只读取文件开头几KB判断格式，之后逐行扫描，遇到时间戳开头的行即为新消息的开始，
+        不会把整个文件读入内存，也不会对全文做两遍匹配。
+        文件开头的 UTF-8 BOM（记事本等Windows程序导出时常见）会被去掉，不影响第一行的匹配。
+        """
+        with open(file_path, 'r', encoding='utf-8-sig') as f:
+            head = f.read(TEXT_FORMAT_SNIFF_SIZE)
+            pattern = _detect_text_format(head)
+            f.seek(0)
             
-            for match in matches:
-                timestamp, sender, content = match
-                content = content.strip()
-                messages.append(ChatMessage(timestamp, sender, content))
-        
-        return messages
+            timestamp = sender = None
+            content_lines = []
+            for line in f:
+                match = pattern.match(line)
+                if match:
+                    if timestamp is not None:
+                        yield ChatMessage(timestamp, sender, '\n'.join(content_lines).strip())
+                    timestamp, sender, first_line = match.groups()
+                    content_lines = [first_line or '']
+                elif timestamp is not None:
+                    content_lines.append(line.rstrip('\r\n'))
+            
+            if timestamp is not None:
+                yield ChatMessage(timestamp, sender, '\n'.join(content_lines).strip())
     
     def parse_html_file(self, file_path: Path) -> List[ChatMessage]:
         """解析HTML格式的聊天记录"""
@@ -190,35 +681,102 @@ class ChatParser:
         
         return messages
     
-    def load_chat_records(self):
-        """加载所有聊天记录文件"""
+    def _parse_files(self, file_paths: List[Path], workers: int) -> Iterator[Tuple[Path, List[ChatMessage]]]:
+        """解析并分析多个文件，解析失败的文件会被跳过"""
+        if workers > 1 and len(file_paths) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [(file_path, executor.submit(_parse_and_analyze, file_path,
+                                                       self.teacher_name, self.student_name))
+                           for file_path in file_paths]
+                for file_path, future in futures:
+                    print(f"正在解析: {file_path.name}")
+                    try:
+                        messages = future.result()
+                    except Exception as e:
+                        print(f"  解析失败: {e}")
+                        continue
+                    print(f"  解析了 {len(messages)} 条消息")
+                    yield file_path, messages
+            return
+        
+        for file_path in file_paths:
+            print(f"正在解析: {file_path.name}")
+            try:
+                messages = self.parse_and_analyze(file_path)
+            except Exception as e:
+                print(f"  解析失败: {e}")
+                continue
+            print(f"  解析了 {len(messages)} 条消息")
+            yield file_path, messages
+    
+    def parse_and_analyze(self, file_path: Path) -> List[ChatMessage]:
+        """解析并分析单个文件，返回按时间排序的消息"""
+        messages = self.parse_file(file_path)
+        for msg in messages:
+            self.classifier.analyze(msg)
+        messages.sort(key=_time_key)
+        return messages
+    
+    def load_chat_records(self, use_cache: bool = True, workers: int = 1):
+        """加载所有聊天记录文件
+        
+        use_cache 为 True 时，未变化的文件直接从 PARSE_CACHE 读取已解析的消息。
+        workers 大于 1 时用进程池并行解析多个文件。每个文件的消息各自排好序，
+        最后用堆做多路归并，不需要再整体排序。
+        """
         if not CHAT_DIR.exists():
             print(f"聊天记录目录不存在: {CHAT_DIR}")
             return
         
-        chat_files = list(CHAT_DIR.glob("*"))
+        # 以"."开头的是本工具自己的清单/缓存文件，不是聊天记录
+        chat_files = [f for f in CHAT_DIR.glob("*") if not f.name.startswith('.') and f.is_file()]
         if not chat_files:
             print(f"未找到聊天记录文件，请将文件放入: {CHAT_DIR}")
             return
         
-        all_messages = []
+        cache = None
+        if use_cache:
+            try:
+                cache = ParseCache()
+            except sqlite3.Error as e:
+                print(f"  打开缓存失败，本次不使用缓存: {e}")
+        per_file: Dict[Path, List[ChatMessage]] = {}
+        to_parse = []
         for file_path in chat_files:
-            if file_path.is_file():
-                print(f"正在解析: {file_path.name}")
+            messages = None
+            if cache:
                 try:
-                    messages = self.parse_file(file_path)
-                    all_messages.extend(messages)
-                    print(f"  解析了 {len(messages)} 条消息")
+                    messages = cache.load(file_path, self.classifier)
                 except Exception as e:
-                    print(f"  解析失败: {e}")
+                    print(f"  读取缓存失败 {file_path.name}: {e}")
+            if messages is None:
+                to_parse.append(file_path)
+            else:
+                print(f"使用缓存: {file_path.name}（{len(messages)} 条消息）")
+                messages.sort(key=_time_key)
+                per_file[file_path] = messages
         
-        # 按时间排序
-        all_messages.sort(key=lambda x: x.timestamp)
-        self.messages = all_messages
+        for file_path, messages in self._parse_files(to_parse, workers):
+            per_file[file_path] = messages
+            if cache:
+                try:
+                    cache.save(file_path, messages, self.classifier)
+                except Exception as e:
+                    print(f"  写入缓存失败 {file_path.name}: {e}")
+        if cache:
+            try:
+                pruned = cache.prune(chat_files)
+                if pruned:
+                    print(f"清理了 {pruned} 个已不存在的文件的缓存")
+            except Exception as e:
+                print(f"  清理缓存失败: {e}")
+            cache.close()
         
-        # 分析每条消息
-        for msg in self.messages:
-            msg.analyze(self.teacher_name, self.student_name)
+        # 按时间归并（保持文件顺序，时间相同的消息顺序与逐个文件排序一致）
+        store = MessageStore(self.classifier.subjects)
+        store.extend(heapq.merge(*(per_file[f] for f in chat_files if f in per_file), key=_time_key))
+        store.sort_by_time()
+        self.messages = store
         
         # 处理图片消息：将图片与前后的问题关联
         self._associate_images_with_questions()
@@ -226,107 +784,253 @@ class ChatParser:
         print(f"总共加载了 {len(self.messages)} 条消息")
     
     def _associate_images_with_questions(self):
-        """将图片消息与前后的问题关联起来"""
-        for i, msg in enumerate(self.messages):
+        """将图片消息与前后的问题关联起来（一次遍历）
+        
+        图片消息关联到前 IMAGE_BACK_WINDOW 条消息中最早的问题；图片消息本身没有图片时，
+        还会关联到后 IMAGE_FORWARD_WINDOW 条消息中的第一个问题。
+        这里只记录引用，问题内容在生成文档时才拼接（见 StoredMessage.display_content）。
+        """
+        store = self.messages
+        recent_questions = deque()  # 最近 IMAGE_BACK_WINDOW 条消息中问题的位置
+        pending_images = deque()    # 等待关联到后面问题的 (位置, 图片引用)
+        
+        for i, msg in enumerate(store):
+            # 每条消息都移出窗口之外的记录，两个队列的长度都不超过窗口大小
+            while recent_questions and i - recent_questions[0] > IMAGE_BACK_WINDOW:
+                recent_questions.popleft()
+            while pending_images and i - pending_images[0][0] > IMAGE_FORWARD_WINDOW:
+                pending_images.popleft()
+            
+            if msg.is_question:
+                # 前面 IMAGE_FORWARD_WINDOW 条以内的图片消息关联到这个问题
+                for _, image_ref in pending_images:
+                    store.attach_image(i, image_ref, before=True)
+                pending_images.clear()
+            
             # 检查是否是图片消息
-            if "图片" in msg.content or "附件" in msg.content:
-                # 向前查找最近的问题（最多往前5条消息）
-                for j in range(max(0, i-5), i):
-                    prev_msg = self.messages[j]
-                    if prev_msg.is_question:
-                        # 将图片添加到问题消息中
-                        if not prev_msg.images:
-                            prev_msg.images = []
-                        # 提取图片编号或文件名
-                        image_ref = msg.content
-                        prev_msg.images.append(image_ref)
-                        # 合并内容
-                        if image_ref not in prev_msg.content:
-                            prev_msg.content += f"\n[{image_ref}]"
-                        break
-                # 如果向前没找到，向后查找（最多往后3条消息）
-                if not msg.images and i < len(self.messages) - 1:
-                    for j in range(i+1, min(i+4, len(self.messages))):
-                        next_msg = self.messages[j]
-                        if next_msg.is_question:
-                            if not next_msg.images:
-                                next_msg.images = []
-                            image_ref = msg.content
-                            next_msg.images.append(image_ref)
-                            if image_ref not in next_msg.content:
-                                next_msg.content = f"[{image_ref}]\n" + next_msg.content
-                            break
-    
-    def filter_by_date(self, start_date: str = "2025-09-01", end_date: str = None):
-        """按日期过滤消息"""
+            content = msg.content
+            if "图片" in content or "附件" in content:
+                # 向前查找问题（最多往前 IMAGE_BACK_WINDOW 条消息）
+                if recent_questions:
+                    store.attach_image(recent_questions[0], content, before=False)
+                # 图片消息本身没有图片时，向后查找（最多往后 IMAGE_FORWARD_WINDOW 条消息）
+                if not store.has_images(i):
+                    pending_images.append((i, content))
+            
+            if msg.is_question:
+                recent_questions.append(i)
+    
+    def filter_by_date(self, start_date: str = "2025-09-01", end_date: str = None) -> TimelineView:
+        """按日期过滤消息，返回按时间排序的零拷贝视图"""
         if end_date is None:
             end_date = datetime.now().strftime("%Y-%m-%d")
         
-        filtered = []
-        for msg in self.messages:
-            msg_date = msg.timestamp.split()[0] if ' ' in msg.timestamp else msg.timestamp[:10]
-            if start_date <= msg_date <= end_date:
-                filtered.append(msg)
-        
-        return filtered
+        return self.messages.between(start_date, end_date)
+
+
+class ReportData:
+    """一次遍历消息得到的分组结果，供各文档生成方法共用
+    
+    - subject_dates: 学科 -> 月份 -> 日期 -> 该学科的消息
+    - subject_questions: 学科 -> [(位置, 提问)]
+    - month_questions: 月份 -> 日期 -> [(位置, 提问)]
+    - month_subject_counts: 月份 -> 学科 -> 提问次数
+    - answer_index: 提问位置 -> 回答位置
+    """
+    def __init__(self, messages: List[ChatMessage]):
+        self.messages = messages
+        self.subject_dates: Dict[str, Dict[str, Dict[str, List[ChatMessage]]]] = {}
+        self.subject_questions: Dict[str, List[Tuple[int, ChatMessage]]] = {}
+        self.month_questions: Dict[str, Dict[str, List[Tuple[int, ChatMessage]]]] = {}
+        self.month_subject_counts: Dict[str, Dict[str, int]] = {}
+        self.answer_index: Dict[int, int] = {}
+    
+    def answer_to(self, q_index: int) -> Optional[ChatMessage]:
+        """查找问题的回答"""
+        a_index = self.answer_index.get(q_index)
+        return self.messages[a_index] if a_index is not None else None
+    
+    def _digest_questions(self, digest, questions):
+        for q_index, q in questions:
+            answer = self.answer_to(q_index)
+            _digest_message(digest, q)
+            digest.update(answer.display_content.encode('utf-8') if answer else b'')
+            digest.update(b'\x1e')
+    
+    def subject_digest(self, subject: str) -> str:
+        """学科总结文档输入内容的摘要"""
+        digest = hashlib.sha256()
+        for month, by_date in sorted(self.subject_dates.get(subject, {}).items()):
+            for date, messages in sorted(by_date.items()):
+                for msg in messages:
+                    _digest_message(digest, msg)
+        digest.update(b'\x1d')
+        self._digest_questions(digest, self.subject_questions.get(subject, [])[:10])
+        return digest.hexdigest()
+    
+    def month_digest(self, month: str) -> str:
+        """月度上课记录输入内容的摘要"""
+        digest = hashlib.sha256()
+        for date, questions in sorted(self.month_questions.get(month, {}).items()):
+            self._digest_questions(digest, questions)
+        digest.update(json.dumps(self.month_subject_counts.get(month, {}), ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+
+def _digest_message(digest, msg: ChatMessage):
+    """把一条消息的时间、发送者、内容加入摘要（字段间用分隔符隔开）"""
+    digest.update(f"{msg.timestamp}\x1f{msg.sender}\x1f{msg.display_content}\x1e".encode('utf-8'))
+
+
+class AnswerTracker:
+    """按时间顺序逐条接收消息，为提问匹配回答
+    
+    回答是提问之后 ANSWER_WINDOW 条消息以内的第一条学生消息。
+    """
+    def __init__(self, is_student):
+        self.is_student = is_student
+        self.answers: Dict[int, int] = {}
+        self.pending = deque()  # 还没有找到回答的提问位置
+    
+    def feed(self, i: int, msg: ChatMessage):
+        pending = self.pending
+        while pending and i - pending[0] > ANSWER_WINDOW:
+            pending.popleft()
+        if pending and self.is_student(msg.sender):
+            for q_index in pending:
+                self.answers[q_index] = i
+            pending.clear()
+        if msg.is_question:
+            pending.append(i)
 
 
 class DocumentGenerator:
     """文档生成器"""
     
-    def __init__(self, parser: ChatParser):
+    def __init__(self, parser: ChatParser, incremental: bool = False):
         self.parser = parser
+        self.student_names = (parser.student_name, "秋璇", "孟秋璇")
+        self._student_senders: Dict[str, bool] = {}
+        self.incremental = incremental
+        self.manifest: Dict[str, str] = self._load_manifest()
+        self.skipped = 0
+        # 图片编号 -> CDN链接（来自 extract_images_from_email 写入的清单），清单变化时文档需要重新生成
+        self.image_urls: Dict[int, str] = load_reference_urls()
+        self._image_digest = hashlib.sha256(
+            json.dumps(sorted(self.image_urls.items())).encode('utf-8')).hexdigest()[:16] if self.image_urls else ''
+    
+    def _load_manifest(self) -> Dict[str, str]:
+        """读取上次生成时记录的文档摘要清单"""
+        try:
+            with open(REPORT_MANIFEST, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != REPORT_FORMAT_VERSION:
+            return {}
+        return data.get('documents', {})
+    
+    def save_manifest(self):
+        """保存文档摘要清单，供下次增量生成使用"""
+        REPORT_MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+        with open(REPORT_MANIFEST, 'w', encoding='utf-8') as f:
+            json.dump({'version': REPORT_FORMAT_VERSION, 'documents': self.manifest},
+                      f, ensure_ascii=False, indent=2, sort_keys=True)
+    
+    def _needs_render(self, doc_path: Path, digest: str) -> bool:
+        """判断文档是否需要重新生成，并在清单中记录新的摘要
         
-    def generate_subject_summary(self, subject: str, messages: List[ChatMessage]):
+        增量模式下，输入摘要与上次相同且文档仍然存在时跳过。
+        """
+        key = doc_path.relative_to(DOCS_DIR).as_posix()
+        if self._image_digest:
+            digest = f"{digest}:{self._image_digest}"
+        unchanged = self.manifest.get(key) == digest and doc_path.exists()
+        self.manifest[key] = digest
+        if self.incremental and unchanged:
+            self.skipped += 1
+            return False
+        return True
+    
+    def _render(self, text: str) -> str:
+        """文档中的消息内容：清单中有的图片引用换成CDN图片链接"""
+        return link_image_refs(text, self.image_urls)
+    
+    def _is_student(self, sender: str) -> bool:
+        """判断发送者是否为学生（支持多种名称匹配，按发送者缓存）"""
+        is_student = self._student_senders.get(sender)
+        if is_student is None:
+            is_student = any(name in sender for name in self.student_names)
+            self._student_senders[sender] = is_student
+        return is_student
+    
+    def aggregate(self, messages: List[ChatMessage]) -> ReportData:
+        """一次遍历消息，同时完成按学科/月份/日期分组和提问-回答匹配"""
+        report = ReportData(messages)
+        tracker = AnswerTracker(self._is_student)
+        
+        for i, msg in enumerate(messages):
+            tracker.feed(i, msg)
+            subject = msg.subject
+            if not subject and not msg.is_question:
+                continue
+            
+            timestamp = msg.timestamp
+            date = timestamp.split()[0] if ' ' in timestamp else timestamp[:10]
+            month = date[:7]  # YYYY-MM
+            
+            if subject:
+                by_date = report.subject_dates.setdefault(subject, {}).setdefault(month, {})
+                by_date.setdefault(date, []).append(msg)
+            
+            if msg.is_question:
+                if subject:
+                    report.subject_questions.setdefault(subject, []).append((i, msg))
+                    counts = report.month_subject_counts.setdefault(month, {})
+                    counts[subject] = counts.get(subject, 0) + 1
+                by_date = report.month_questions.setdefault(month, {})
+                by_date.setdefault(date, []).append((i, msg))
+        
+        report.answer_index = tracker.answers
+        return report
+    
+    def generate_subject_summary(self, subject: str, report: ReportData):
         """生成学科总结文档"""
         doc_path = DOCS_DIR / f"{subject}总结.md"
+        if not self._needs_render(doc_path, report.subject_digest(subject)):
+            return
         
-        # 按日期分组
-        by_date = {}
-        questions = []
-        knowledge_points = []
-        error_points = []
-        
-        for msg in messages:
-            if msg.subject == subject:
-                date = msg.timestamp.split()[0] if ' ' in msg.timestamp else msg.timestamp[:10]
-                if date not in by_date:
-                    by_date[date] = []
-                by_date[date].append(msg)
-                
-                if msg.is_question:
-                    questions.append(msg)
+        by_month = report.subject_dates.get(subject, {})
+        questions = report.subject_questions.get(subject, [])
         
         # 生成文档内容
         content = f"# {subject}学习总结\n\n"
         content += "## 时间线\n\n"
         
         # 按月份组织
-        current_month = None
-        for date in sorted(by_date.keys()):
-            month = date[:7]  # YYYY-MM
-            if month != current_month:
-                if current_month is not None:
-                    content += "\n---\n\n"
-                content += f"### {month}\n\n"
-                current_month = month
+        for n, month in enumerate(sorted(by_month)):
+            if n:
+                content += "\n---\n\n"
+            content += f"### {month}\n\n"
             
-            content += f"**{date}**\n\n"
-            for msg in by_date[date]:
-                content += f"- [{msg.timestamp}] {msg.sender}: {msg.content[:100]}...\n"
-            content += "\n"
+            by_date = by_month[month]
+            for date in sorted(by_date):
+                content += f"**{date}**\n\n"
+                for msg in by_date[date]:
+                    content += f"- [{msg.timestamp}] {msg.sender}: {self._render(msg.display_content[:100])}...\n"
+                content += "\n"
         
         content += "\n---\n\n"
         content += "## 重点问题\n\n"
         
-        for i, q in enumerate(questions[:10], 1):  # 最多显示10个问题
+        for i, (q_index, q) in enumerate(questions[:10], 1):  # 最多显示10个问题
             content += f"### 问题{i}\n\n"
             content += f"**日期**：{q.timestamp}\n\n"
-            content += f"**问题**：{q.content}\n\n"
+            content += f"**问题**：{self._render(q.display_content)}\n\n"
             # 查找对应的回答
-            answer = self._find_answer(q, messages)
+            answer = report.answer_to(q_index)
             if answer:
-                content += f"**解答**：{answer.content}\n\n"
+                content += f"**解答**：{self._render(answer.display_content)}\n\n"
             content += f"**知识点**：_待补充_\n\n"
             content += "---\n\n"
         
@@ -336,49 +1040,24 @@ class DocumentGenerator:
         
         print(f"已生成: {doc_path}")
     
-    def _find_answer(self, question: ChatMessage, messages: List[ChatMessage]) -> Optional[ChatMessage]:
-        """查找问题的回答"""
-        q_index = messages.index(question)
-        # 查找问题后的第一条学生消息（支持多种名称匹配）
-        student_names = [self.parser.student_name, "秋璇", "孟秋璇"]
-        for i in range(q_index + 1, min(q_index + 5, len(messages))):
-            if messages[i].sender in student_names or any(name in messages[i].sender for name in student_names):
-                return messages[i]
-        return None
-    
-    def generate_class_records(self, messages: List[ChatMessage]):
+    def generate_class_records(self, report: ReportData):
         """生成上课记录"""
-        # 按月份分组
-        by_month = {}
-        
-        for msg in messages:
-            if msg.is_question:
-                date = msg.timestamp.split()[0] if ' ' in msg.timestamp else msg.timestamp[:10]
-                month = date[:7]  # YYYY-MM
-                if month not in by_month:
-                    by_month[month] = []
-                by_month[month].append(msg)
-        
-        for month, questions in by_month.items():
+        for month, by_date in report.month_questions.items():
             doc_path = CLASS_RECORDS_DIR / f"{month}.md"
+            if not self._needs_render(doc_path, report.month_digest(month)):
+                continue
             
             content = f"# {month}上课记录\n\n"
             
-            # 按日期分组
-            by_date = {}
-            for q in questions:
-                date = q.timestamp.split()[0] if ' ' in q.timestamp else q.timestamp[:10]
-                if date not in by_date:
-                    by_date[date] = []
-                by_date[date].append(q)
-            
-            for date in sorted(by_date.keys()):
+            question_count = 0
+            for date in sorted(by_date):
                 content += f"## {date}\n\n"
-                for q in by_date[date]:
-                    content += f"### 提问内容\n\n{q.content}\n\n"
-                    answer = self._find_answer(q, messages)
+                for q_index, q in by_date[date]:
+                    question_count += 1
+                    content += f"### 提问内容\n\n{self._render(q.display_content)}\n\n"
+                    answer = report.answer_to(q_index)
                     if answer:
-                        content += f"### 学生回答\n\n{answer.content}\n\n"
+                        content += f"### 学生回答\n\n{self._render(answer.display_content)}\n\n"
                     content += f"### 知识点\n\n_待补充_\n\n"
                     content += f"### 教学分析\n\n"
                     content += f"**回答质量评估**：_待补充_\n\n"
@@ -390,14 +1069,9 @@ class DocumentGenerator:
             # 本月总结
             content += "## 本月总结\n\n"
             content += f"### 提问次数统计\n\n"
-            content += f"- 总提问次数：{len(questions)}\n"
-            
-            subjects_count = {}
-            for q in questions:
-                if q.subject:
-                    subjects_count[q.subject] = subjects_count.get(q.subject, 0) + 1
+            content += f"- 总提问次数：{question_count}\n"
             
-            for subject, count in subjects_count.items():
+            for subject, count in report.month_subject_counts.get(month, {}).items():
                 content += f"- {subject}相关：{count}\n"
             
             content += "\n### 学习进展\n\n_待补充_\n\n"
@@ -411,6 +1085,15 @@ class DocumentGenerator:
 
 def main():
     """主函数"""
+    arg_parser = argparse.ArgumentParser(description="微信聊天记录解析工具")
+    arg_parser.add_argument("--incremental", action="store_true",
+                            help="增量生成：只重写输入内容有变化的文档")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="忽略已解析消息的缓存，重新解析所有聊天记录文件")
+    arg_parser.add_argument("--workers", type=int, default=1,
+                            help="并行解析聊天记录文件的进程数（默认 1，即逐个解析）")
+    args = arg_parser.parse_args()
+    
     print("=" * 50)
     print("微信聊天记录解析工具")
     print("=" * 50)
@@ -426,7 +1109,7 @@ def main():
     parser = ChatParser(teacher_name="孟祥志", student_name="孟秋璇")
     
     # 加载聊天记录
-    parser.load_chat_records()
+    parser.load_chat_records(use_cache=not args.no_cache, workers=args.workers)
     
     if not parser.messages:
         print("\n未找到聊天记录，请先导出聊天记录到 assets/chat/ 目录")
@@ -436,19 +1119,22 @@ def main():
     filtered_messages = parser.filter_by_date("2025-09-01")
     print(f"过滤后（2025-09-01至今）: {len(filtered_messages)} 条消息")
     
-    # 生成文档
-    generator = DocumentGenerator(parser)
+    # 生成文档：一次遍历完成分组，供所有文档共用
+    generator = DocumentGenerator(parser, incremental=args.incremental)
+    report = generator.aggregate(filtered_messages)
     
     # 生成各学科总结
     for subject in ["数学", "物理", "化学"]:
-        subject_messages = [m for m in filtered_messages if m.subject == subject]
-        if subject_messages:
-            generator.generate_subject_summary(subject, filtered_messages)
+        if subject in report.subject_dates:
+            generator.generate_subject_summary(subject, report)
     
     # 生成上课记录
-    question_messages = [m for m in filtered_messages if m.is_question]
-    if question_messages:
-        generator.generate_class_records(filtered_messages)
+    if report.month_questions:
+        generator.generate_class_records(report)
+    
+    generator.save_manifest()
+    if generator.skipped:
+        print(f"\n内容未变化，跳过了 {generator.skipped} 份文档")
     
     print("\n处理完成！")
 
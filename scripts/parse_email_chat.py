@@ -16,12 +16,62 @@ from html.parser import HTMLParser
 import html
 import zipfile
 import base64
+import itertools
+import io
+import mimetypes
+import argparse
+
+from dedup import MessageDeduplicator
+from email_ingest import IMAGE_EXTENSIONS, ingest_email
+from text_decoding import decode_bytes, decode_stats_summary
+from timeline import Timeline
 
 # 项目目录
 PROJECT_ROOT = Path(__file__).parent.parent
 CHAT_DIR = PROJECT_ROOT / "assets" / "chat"
 IMAGES_DIR = PROJECT_ROOT / "assets" / "images"
 
+# 完整时间戳：2025-09-01 10:30:15 或 2025年9月1日 10:30:15
+FULL_TIMESTAMP = re.compile(
+    r'(\d{4}[-/]\d{1,2}[-/]\d{1,2}[\s,]\d{1,2}:\d{1,2}:\d{1,2})|(\d{4}年\d{1,2}月\d{1,2}日[\s,]\d{1,2}:\d{1,2}:\d{1,2})'
+)
+
+# 纯文本聊天记录中的日期分隔行、“发送者  时间”行和已知的发送者
+DATE_SEPARATOR = re.compile(r'[—\-]+[\s]*(\d{4}[-/]\d{1,2}[-/]\d{1,2})[\s]*[—\-]+')
+SENDER_TIME_LINE = re.compile(r'^([^\s]+)\s+(\d{1,2}:\d{2})$')
+KNOWN_SENDERS = ('孟秋璇', '孟祥志', '秋璇', '四叔')
+KNOWN_SENDER_PREFIX = re.compile('|'.join(KNOWN_SENDERS))
+
+# HTML文本块中的时间戳，按顺序尝试
+BLOCK_TIME_PATTERNS = (
+    re.compile(r'(\d{4}[-/]\d{1,2}[-/]\d{1,2}[\s,]\d{1,2}:\d{1,2}:\d{1,2})'),  # 2025-09-01 10:30:15
+    re.compile(r'(\d{4}年\d{1,2}月\d{1,2}日[\s,]\d{1,2}:\d{1,2}:\d{1,2})'),    # 2025年9月1日 10:30:15
+    re.compile(r'(\d{1,2}:\d{2}:\d{2})'),                                      # 10:30:15
+)
+SENDER_SEPARATOR = re.compile('[：:]')
+
+# 内容不属于聊天文本的标签
+SKIPPED_TAGS = ('style', 'script')
+
+# HTML转文本用到的模式：style/script 块、标签
+HTML_SKIPPED_BLOCK = re.compile(r'<style[^>]*>.*?</style>|<script[^>]*>.*?</script>', re.DOTALL)
+HTML_SKIPPED_START = re.compile(r'<style[^>]*>|<script[^>]*>')
+HTML_TAG = re.compile(r'<[^>]+>')
+
+# 解析HTML时每次送入解析器的字符数
+HTML_CHUNK_SIZE = 64 * 1024
+
+# 会被解析的附件类型
+TEXT_ATTACHMENT_EXTENSIONS = ('.txt', '.html', '.htm')
+PARSED_ATTACHMENT_EXTENSIONS = TEXT_ATTACHMENT_EXTENSIONS + ('.zip',)
+
+# ZIP附件的解压限制（按实际解压出的字节数检查，不信任ZIP中记录的大小）
+ZIP_MAX_MEMBERS = 10000                    # 成员数量
+ZIP_MAX_MEMBER_SIZE = 200 * 1024 * 1024    # 单个成员解压后的大小
+ZIP_MAX_TOTAL_SIZE = 1024 * 1024 * 1024    # 所有成员解压后的总大小
+ZIP_MAX_RATIO = 200                        # 解压后与压缩前的大小之比
+ZIP_MIN_RATIO_LIMIT = 1024 * 1024          # 压缩比限制不低于该大小（很小的成员压缩比可能很高）
+
 class ChatHTMLParser(HTMLParser):
     """解析HTML中的聊天记录"""
     def __init__(self):
@@ -60,8 +110,7 @@ class ChatHTMLParser(HTMLParser):
             text = data.strip()
             if text:
                 # 检测时间戳格式
-                time_pattern = r'(\d{4}[-/]\d{1,2}[-/]\d{1,2}[\s,]\d{1,2}:\d{1,2}:\d{1,2})|(\d{4}年\d{1,2}月\d{1,2}日[\s,]\d{1,2}:\d{1,2}:\d{1,2})'
-                if re.search(time_pattern, text):
+                if FULL_TIMESTAMP.search(text):
                     self.current_message['timestamp'] = text
                 # 检测发送者
                 elif any(keyword in text for keyword in ['您', '我', '秋璇', '：', ':']):
@@ -70,161 +119,192 @@ class ChatHTMLParser(HTMLParser):
                 
                 self.current_text += text + " "
 
+class ChatHTMLBlockParser(ChatHTMLParser):
+    """在 ChatHTMLParser 的同一次遍历中，按“标签到下一个结束标签”切分文本块
+    
+    块内的标签去掉，实体已解码；style/script 的内容不计入。
+    """
+    def __init__(self):
+        super().__init__()
+        self.blocks = []
+        self._block = None  # 当前文本块的片段，None 表示不在块中
+        self._skipping = False
+    
+    def handle_starttag(self, tag, attrs):
+        super().handle_starttag(tag, attrs)
+        if tag in SKIPPED_TAGS:
+            self._skipping = True
+        elif self._block is None:
+            self._block = []
+    
+    def handle_startendtag(self, tag, attrs):
+        # <br/> 等自闭合标签：ChatHTMLParser 按开始+结束处理，文本块只当作开始标签
+        ChatHTMLParser.handle_starttag(self, tag, attrs)
+        ChatHTMLParser.handle_endtag(self, tag)
+        if self._block is None:
+            self._block = []
+    
+    def handle_endtag(self, tag):
+        super().handle_endtag(tag)
+        if tag in SKIPPED_TAGS:
+            self._skipping = False
+        if self._block is None:
+            self._block = []
+        else:
+            self.blocks.append(''.join(self._block))
+            self._block = None
+    
+    def handle_data(self, data):
+        super().handle_data(data)
+        if self._block is not None and not self._skipping:
+            self._block.append(data)
+    
+    def handle_comment(self, data):
+        # 注释、声明等也相当于一个标签，可以开始一个文本块
+        if self._block is None:
+            self._block = []
+    
+    handle_decl = handle_pi = unknown_decl = handle_comment
+
+def _message_from_block(block):
+    """把一个HTML文本块转换为消息，不像消息时返回 None"""
+    text = block.strip()
+    if len(text) <= 5:
+        return None
+    
+    # 查找时间戳
+    timestamp = None
+    for pattern in BLOCK_TIME_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            timestamp = match.group(1)
+            break
+    
+    # 查找发送者
+    sender = None
+    content_text = text
+    if '：' in text or ':' in text:
+        parts = SENDER_SEPARATOR.split(text, 1)
+        if len(parts) == 2:
+            sender = parts[0].strip()
+            content_text = parts[1].strip()
+    
+    if content_text and len(content_text) > 3:
+        return {
+            'timestamp': timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'sender': sender or '未知',
+            'content': content_text
+        }
+    return None
+
 def parse_html_email(html_file_path):
     """解析HTML邮件文件"""
-    messages = []
-    
     with open(html_file_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 方法1: 使用HTML解析器
-    parser = ChatHTMLParser()
-    parser.feed(content)
-    messages.extend(parser.messages)
-    
-    # 方法2: 使用正则表达式提取聊天记录
-    # 匹配常见的时间戳格式
-    time_patterns = [
-        r'(\d{4}[-/]\d{1,2}[-/]\d{1,2}[\s,]\d{1,2}:\d{1,2}:\d{1,2})',  # 2025-09-01 10:30:15
-        r'(\d{4}年\d{1,2}月\d{1,2}日[\s,]\d{1,2}:\d{1,2}:\d{1,2})',    # 2025年9月1日 10:30:15
-        r'(\d{1,2}:\d{2}:\d{2})',                                      # 10:30:15
-    ]
-    
-    # 提取所有可能的消息块
-    # 微信邮件通常包含表格或div结构
-    message_blocks = re.findall(r'<[^>]*>(.*?)</[^>]*>', content, re.DOTALL)
-    
-    for block in message_blocks:
-        # 清理HTML标签
-        text = re.sub(r'<[^>]+>', '', block)
-        text = html.unescape(text)
-        text = text.strip()
-        
-        if len(text) > 5:
-            # 查找时间戳
-            timestamp = None
-            for pattern in time_patterns:
-                match = re.search(pattern, text)
-                if match:
-                    timestamp = match.group(1)
-                    break
-            
-            # 查找发送者
-            sender = None
-            if '：' in text or ':' in text:
-                parts = re.split('[：:]', text, 1)
-                if len(parts) == 2:
-                    sender = parts[0].strip()
-                    content_text = parts[1].strip()
-                else:
-                    content_text = text
-            else:
-                content_text = text
-            
-            if content_text and len(content_text) > 3:
-                messages.append({
-                    'timestamp': timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'sender': sender or '未知',
-                    'content': content_text
-                })
-    
-    # 去重
-    unique_messages = []
-    seen = set()
-    for msg in messages:
-        content = msg.get('content', '')
-        if content and content not in seen:
-            seen.add(content)
-            unique_messages.append(msg)
-    
-    return unique_messages
+        return parse_html_stream(f)
+
+def parse_html_stream(html_file):
+    """从已打开的HTML文本流解析聊天记录
+    
+    分块读入，一次遍历同时得到 ChatHTMLParser 识别的消息（方法1）和按文本块提取的消息（方法2）。
+    """
+    parser = ChatHTMLBlockParser()
+    block_messages = []
+    
+    for chunk in iter(lambda: html_file.read(HTML_CHUNK_SIZE), ''):
+        parser.feed(chunk)
+        for block in parser.blocks:
+            msg = _message_from_block(block)
+            if msg:
+                block_messages.append(msg)
+        parser.blocks.clear()
+    parser.close()
+    
+    # 去重：两种方法会提取出同一段内容，而方法2的时间和发送者不可靠，只按内容判断
+    with MessageDeduplicator() as dedup:
+        return list(dedup.unique(itertools.chain(parser.messages, block_messages), content_only=True))
+
+def _normalize_date(date_str):
+    """把 2025/10/7、2025-10-7 等日期标准化为 2025-10-07"""
+    date_str = date_str.replace('/', '-')
+    parts = date_str.split('-')
+    if len(parts) == 3:
+        year, month, day = parts
+        return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+    return date_str
 
 def parse_text_content(text_content):
-    """解析纯文本格式的聊天记录"""
+    """解析纯文本格式的聊天记录（text_content 为字符串或逐行产出文本的可迭代对象）
+    
+    微信邮件格式：
+    —————  2025-10-7  —————
+    孟秋璇  19:39
+    消息内容
+    孟祥志  22:15
+    消息内容
+    
+    逐行的状态机：先用廉价的字符判断决定要尝试哪些模式——日期分隔行含 —/-，
+    “发送者  时间”行以 :dd 结尾，带完整时间戳的行含冒号；普通内容行不做任何正则匹配。
+    """
     messages = []
-    lines = text_content.split('\n')
+    lines = text_content.split('\n') if isinstance(text_content, str) else text_content
     
     current_message = {}
     current_content = []
     current_date = None  # 当前日期（从分隔符中提取）
-    
-    # 微信邮件格式：
-    # —————  2025-10-7  —————
-    # 孟秋璇  19:39
-    # 消息内容
-    # 孟祥志  22:15
-    # 消息内容
+    now = datetime.now()  # 没有日期信息时使用的默认时间
     
     for line in lines:
         line = line.strip()
         if not line:
             if current_content and current_message:
                 current_message['content'] = '\n'.join(current_content)
-                messages.append(current_message.copy())
+                messages.append(current_message)
                 current_message = {}
                 current_content = []
             continue
         
-        # 匹配日期分隔符：—————  2025-10-7  —————
-        date_sep_match = re.search(r'[—\-]+[\s]*(\d{4}[-/]\d{1,2}[-/]\d{1,2})[\s]*[—\-]+', line)
-        if date_sep_match:
-            current_date = date_sep_match.group(1)
-            # 标准化日期格式
-            current_date = re.sub(r'[/]', '-', current_date)
-            parts = current_date.split('-')
-            if len(parts) == 3:
-                year, month, day = parts
-                current_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            continue
-        
-        # 匹配发送者和时间：孟秋璇  19:39 或 孟祥志  22:15
-        sender_time_match = re.search(r'^([^\s]+)\s+(\d{1,2}:\d{2})$', line)
-        if sender_time_match:
-            # 保存上一条消息
-            if current_content and current_message:
-                current_message['content'] = '\n'.join(current_content)
-                messages.append(current_message.copy())
-            
-            # 新消息开始
-            sender = sender_time_match.group(1)
-            time_str = sender_time_match.group(2)
-            
-            # 构建完整时间戳
-            if current_date:
-                timestamp = f"{current_date} {time_str}:00"
-            else:
-                timestamp = datetime.now().strftime('%Y-%m-%d') + f" {time_str}:00"
-            
-            current_message = {
-                'timestamp': timestamp,
-                'sender': sender
-            }
-            current_content = []
-            continue
+        # 日期分隔符：—————  2025-10-7  —————
+        if '—' in line or '-' in line:
+            match = DATE_SEPARATOR.search(line)
+            if match:
+                current_date = _normalize_date(match.group(1))
+                continue
         
-        # 匹配标准时间戳格式
-        time_pattern = r'(\d{4}[-/]\d{1,2}[-/]\d{1,2}[\s,]\d{1,2}:\d{1,2}:\d{1,2})|(\d{4}年\d{1,2}月\d{1,2}日[\s,]\d{1,2}:\d{1,2}:\d{1,2})'
-        time_match = re.search(time_pattern, line)
+        # 发送者和时间：孟秋璇  19:39
+        if line[-3:-2] == ':' and line[-1].isdecimal():
+            match = SENDER_TIME_LINE.match(line)
+            if match:
+                # 保存上一条消息
+                if current_content and current_message:
+                    current_message['content'] = '\n'.join(current_content)
+                    messages.append(current_message)
+                
+                sender, time_str = match.groups()
+                date = current_date or now.strftime('%Y-%m-%d')
+                current_message = {
+                    'timestamp': f"{date} {time_str}:00",
+                    'sender': sender
+                }
+                current_content = []
+                continue
         
-        if time_match:
-            # 新消息开始
-            if current_content and current_message:
-                current_message['content'] = '\n'.join(current_content)
-                messages.append(current_message.copy())
-            
-            current_message = {'timestamp': time_match.group(0)}
-            current_content = []
-            
-            # 提取发送者
-            parts = line.split(time_match.group(0), 1)
-            if len(parts) > 1:
-                sender_part = parts[0].strip()
-                content_part = parts[1].strip()
+        # 标准时间戳格式：2025-09-01 10:30:15 发送者：内容
+        if ':' in line:
+            match = FULL_TIMESTAMP.search(line)
+            if match:
+                if current_content and current_message:
+                    current_message['content'] = '\n'.join(current_content)
+                    messages.append(current_message)
+                
+                timestamp = match.group(0)
+                current_message = {'timestamp': timestamp}
+                current_content = []
                 
-                # 尝试提取发送者
+                sender_part, content_part = line.split(timestamp, 1)
+                sender_part = sender_part.strip()
+                content_part = content_part.strip()
                 if '：' in sender_part or ':' in sender_part:
-                    sender = sender_part.split('：')[0].split(':')[0].strip()
-                    current_message['sender'] = sender
+                    current_message['sender'] = sender_part.split('：')[0].split(':')[0].strip()
                     if content_part:
                         current_content.append(content_part)
                 else:
@@ -234,36 +314,25 @@ def parse_text_content(text_content):
                         current_message['sender'] = words[-1]
                         if content_part:
                             current_content.append(content_part)
-        else:
-            # 继续当前消息
-            if current_message:
-                current_content.append(line)
+                continue
+        
+        # 继续当前消息
+        if current_message:
+            current_content.append(line)
+        elif len(line) > 3:
+            # 没有时间戳的消息：行首是已知的发送者名称时，这是新消息的开始
+            default_timestamp = current_date + " 00:00:00" if current_date else now.strftime('%Y-%m-%d %H:%M:%S')
+            match = KNOWN_SENDER_PREFIX.match(line)
+            if match:
+                current_message = {'timestamp': default_timestamp, 'sender': match.group()}
+                # 移除发送者名称，剩余是内容
+                content = line[match.end():].strip()
+                if content:
+                    current_content.append(content)
             else:
-                # 可能是没有时间戳的消息，尝试识别发送者
-                # 如果行首是已知的发送者名称
-                if line and len(line) > 3:
-                    # 检查是否是发送者名称（孟秋璇、孟祥志等）
-                    known_senders = ['孟秋璇', '孟祥志', '秋璇', '四叔']
-                    for sender_name in known_senders:
-                        if line.startswith(sender_name):
-                            # 这可能是新消息的开始
-                            current_message = {
-                                'timestamp': current_date + " 00:00:00" if current_date else datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                'sender': sender_name
-                            }
-                            # 移除发送者名称，剩余是内容
-                            content = line[len(sender_name):].strip()
-                            if content:
-                                current_content.append(content)
-                            break
-                    else:
-                        # 不是发送者名称，可能是消息内容的一部分
-                        if not current_message:
-                            current_message = {
-                                'timestamp': current_date + " 00:00:00" if current_date else datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                'sender': '未知'
-                            }
-                        current_content.append(line)
+                # 不是发送者名称，可能是消息内容的一部分
+                current_message = {'timestamp': default_timestamp, 'sender': '未知'}
+                current_content.append(line)
     
     # 添加最后一条消息
     if current_content and current_message:
@@ -272,104 +341,117 @@ def parse_text_content(text_content):
     
     return messages
 
-def extract_from_email_file(email_file_path):
-    """从邮件文件中提取内容"""
+def read_email_streaming(email_file_path, attachment_dir=CHAT_DIR, images=None):
+    """流式读取邮件，返回 (HTML正文, 文本正文, 附件中的消息)
+    
+    附件按传输编码边读边解码，直接写入 attachment_dir；内存中只保留HTML和文本正文。
+    images 为列表时，同一次遍历中找到的图片也追加到其中（供图片提取使用）。
+    """
+    content = ingest_email(email_file_path, attachment_dir, collect_images=images is not None)
+    if images is not None:
+        images.extend(content.images)
+    
+    attach_messages = []
+    for filename, attach_path in content.attachments:
+        print(f"  提取附件: {filename}")
+        # 如果是文本、HTML或ZIP附件，解析它
+        if filename.lower().endswith(PARSED_ATTACHMENT_EXTENSIONS):
+            try:
+                attach_messages.extend(parse_attachment(attach_path, images))
+            except Exception as e:
+                print(f"  解析附件失败 {filename}: {e}")
+    
+    html_payload = content.bodies.get("text/html", b"")
+    text_payload = content.bodies.get("text/plain", b"")
+    html_body = decode_bytes(html_payload, content.charsets.get("text/html")) if html_payload else ""
+    body = decode_bytes(text_payload, content.charsets.get("text/plain")) if text_payload else ""
+    return html_body, body, attach_messages
+
+def read_email_in_memory(email_file_path, attachment_dir=CHAT_DIR):
+    """把整封邮件读入内存解析，返回 (HTML正文, 文本正文, 附件中的消息)"""
     all_messages = []
     
-    # 尝试解析为.eml文件
-    try:
-        with open(email_file_path, 'rb') as f:
-            msg = email.message_from_bytes(f.read(), policy=policy.default)
-        
-        # 提取邮件正文
-        body = ""
-        html_body = ""
-        
-        if msg.is_multipart():
-            for part in msg.walk():
-                content_type = part.get_content_type()
-                content_disposition = str(part.get("Content-Disposition", ""))
-                
-                # 跳过附件部分（会在后面单独处理）
-                if "attachment" in content_disposition.lower():
-                    filename = part.get_filename()
-                    if filename:
-                        # 保存附件
-                        attach_path = CHAT_DIR / filename
-                        try:
-                            with open(attach_path, 'wb') as attach_file:
-                                payload = part.get_payload(decode=True)
-                                if payload:
-                                    attach_file.write(payload)
-                            print(f"  提取附件: {filename}")
-                            
-                            # 如果是文本或HTML附件，解析它
-                            if filename.endswith(('.txt', '.html', '.htm')):
-                                attach_messages = parse_attachment(attach_path)
-                                all_messages.extend(attach_messages)
-                        except Exception as e:
-                            print(f"  保存附件失败 {filename}: {e}")
-                    continue
-                
-                # 提取HTML正文（优先）
-                if content_type == "text/html" and not html_body:
-                    try:
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            # 尝试多种编码
-                            for encoding in ['utf-8', 'gbk', 'gb2312', 'latin1']:
-                                try:
-                                    html_body = payload.decode(encoding)
-                                    break
-                                except:
-                                    continue
-                            if not html_body:
-                                html_body = payload.decode('utf-8', errors='ignore')
-                    except Exception as e:
-                        print(f"  提取HTML正文失败: {e}")
-                
-                # 提取纯文本正文（作为备选）
-                elif content_type == "text/plain" and not body:
+    with open(email_file_path, 'rb') as f:
+        msg = email.message_from_bytes(f.read(), policy=policy.default)
+    
+    # 提取邮件正文
+    body = ""
+    html_body = ""
+    
+    if msg.is_multipart():
+        for part in msg.walk():
+            content_type = part.get_content_type()
+            content_disposition = str(part.get("Content-Disposition", ""))
+            
+            # 跳过附件部分（会在后面单独处理）
+            if "attachment" in content_disposition.lower():
+                filename = part.get_filename()
+                if filename:
+                    # 保存附件
+                    attach_path = attachment_dir / filename
                     try:
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            # 尝试多种编码
-                            for encoding in ['utf-8', 'gbk', 'gb2312', 'latin1']:
-                                try:
-                                    body = payload.decode(encoding)
-                                    break
-                                except:
-                                    continue
-                            if not body:
-                                body = payload.decode('utf-8', errors='ignore')
+                        with open(attach_path, 'wb') as attach_file:
+                            payload = part.get_payload(decode=True)
+                            if payload:
+                                attach_file.write(payload)
+                        print(f"  提取附件: {filename}")
+                        
+                        # 如果是文本、HTML或ZIP附件，解析它
+                        if filename.lower().endswith(PARSED_ATTACHMENT_EXTENSIONS):
+                            attach_messages = parse_attachment(attach_path)
+                            all_messages.extend(attach_messages)
                     except Exception as e:
-                        print(f"  提取文本正文失败: {e}")
+                        print(f"  保存附件失败 {filename}: {e}")
+                continue
+            
+            # 提取HTML正文（优先）
+            if content_type == "text/html" and not html_body:
+                try:
+                    payload = part.get_payload(decode=True)
+                    if payload:
+                        html_body = decode_bytes(payload, part.get_content_charset())
+                except Exception as e:
+                    print(f"  提取HTML正文失败: {e}")
+            
+            # 提取纯文本正文（作为备选）
+            elif content_type == "text/plain" and not body:
+                try:
+                    payload = part.get_payload(decode=True)
+                    if payload:
+                        body = decode_bytes(payload, part.get_content_charset())
+                except Exception as e:
+                    print(f"  提取文本正文失败: {e}")
+    else:
+        # 单部分邮件
+        try:
+            payload = msg.get_payload(decode=True)
+            if payload:
+                content_type = msg.get_content_type()
+                if content_type == "text/html":
+                    html_body = decode_bytes(payload, msg.get_content_charset())
+                else:
+                    body = decode_bytes(payload, msg.get_content_charset())
+        except Exception as e:
+            print(f"  提取单部分邮件内容失败: {e}")
+    
+    return html_body, body, all_messages
+
+def extract_from_email_file(email_file_path, streaming=True, attachment_dir=CHAT_DIR, images=None):
+    """从邮件文件中提取内容
+    
+    streaming 为 True 时（仅对 .eml/.mhtml），流式解析邮件，附件边解码边写入 attachment_dir，
+    内存中只保留正文；否则整封邮件读入内存解析。
+    images 为列表时（仅流式解析），顺便收集邮件中的图片，不需要再单独解析一遍邮件。
+    """
+    all_messages = []
+    
+    # 尝试解析为.eml文件
+    try:
+        if streaming and email_file_path.suffix.lower() in ['.eml', '.mhtml']:
+            html_body, body, attach_messages = read_email_streaming(email_file_path, attachment_dir, images)
         else:
-            # 单部分邮件
-            try:
-                payload = msg.get_payload(decode=True)
-                if payload:
-                    content_type = msg.get_content_type()
-                    if content_type == "text/html":
-                        for encoding in ['utf-8', 'gbk', 'gb2312', 'latin1']:
-                            try:
-                                html_body = payload.decode(encoding)
-                                break
-                            except:
-                                continue
-                        if not html_body:
-                            html_body = payload.decode('utf-8', errors='ignore')
-                    else:
-                        for encoding in ['utf-8', 'gbk', 'gb2312', 'latin1']:
-                            try:
-                                body = payload.decode(encoding)
-                                break
-                            except:
-                                continue
-                        if not body:
-                            body = payload.decode('utf-8', errors='ignore')
-            except Exception as e:
-                print(f"  提取单部分邮件内容失败: {e}")
+            html_body, body, attach_messages = read_email_in_memory(email_file_path, attachment_dir)
+        all_messages.extend(attach_messages)
         
         # 优先解析HTML正文（通常包含更完整的格式）
         if html_body:
@@ -396,80 +478,230 @@ def extract_from_email_file(email_file_path):
     
     return all_messages
 
+class HTMLTextExtractor:
+    """增量地把HTML转换为文本行：删除 style/script 块，每个标签处断行，解码实体
+    
+    送入的HTML在安全位置（标签之后、style/script 块之外）切开，每段只用预编译的正则处理一次，
+    结果与对整串依次替换一致，但不需要把整个正文和它的多份副本同时放在内存中。
+    未闭合的块只在新送入的分块中查找结束标签，很长的内联样式/脚本也不会被反复扫描。
+    """
+    def __init__(self):
+        self._pending = ''       # 还不能处理的HTML（可能是不完整的标签）
+        self._text = ''          # 已转换、但还不是完整一行的文本
+        self._block_end = None   # 处于未闭合的 style/script 块中时，等待的结束标签
+        self._block_parts = []   # 未闭合的块（从开始标签起）按送入的分块保存，找到结束标签时才拼接
+        self._block_tail = ''    # 块的最后几个字符，用于查找跨分块的结束标签
+    
+    def _convert(self, markup):
+        text = HTML_SKIPPED_BLOCK.sub('', markup)
+        text = HTML_TAG.sub('\n', text)
+        return html.unescape(text) if '&' in text else text
+    
+    def feed(self, chunk):
+        """送入一块HTML，返回已完整的文本行"""
+        pos = 0
+        if self._block_end:
+            # 仍在未闭合的块中：只在新送入的分块（加上上一块末尾的几个字符）中查找结束标签
+            window = self._block_tail + chunk
+            end = window.find(self._block_end)
+            self._block_parts.append(chunk)
+            if end < 0:
+                self._block_tail = window[-(len(self._block_end) - 1):]
+                return []
+            markup = ''.join(self._block_parts)
+            pos = len(markup) - len(window) + end + len(self._block_end)
+            self._block_end = None
+            self._block_parts = []
+        else:
+            markup = self._pending + chunk
+        # 最后一个 > 之后不可能处于标签中间；实体也不会跨越标签
+        cut = markup.rfind('>') + 1
+        # 跳过已闭合的 style/script 块，不能从未闭合的块中间切开
+        while True:
+            match = HTML_SKIPPED_START.search(markup, pos, cut)
+            if not match:
+                break
+            end_tag = '</style>' if markup.startswith('<style', match.start()) else '</script>'
+            end = markup.find(end_tag, match.end())
+            if end < 0:
+                cut = match.start()
+                self._block_end = end_tag
+                self._block_parts = [markup[cut:]]
+                self._block_tail = markup[-(len(end_tag) - 1):]
+                break
+            pos = end + len(end_tag)
+        self._pending = '' if self._block_end else markup[cut:]
+        return self._lines(self._convert(markup[:cut]), final=False)
+    
+    def close(self):
+        """输入结束，返回剩余的文本行"""
+        markup = ''.join(self._block_parts) if self._block_end else self._pending
+        self._pending = ''
+        self._block_end = None
+        self._block_parts = []
+        return self._lines(self._convert(markup), final=True)
+    
+    def _lines(self, text, final):
+        lines = (self._text + text).split('\n')
+        self._text = '' if final else lines.pop()
+        return lines
+
+def iter_html_lines(chunks):
+    """把分块的HTML逐块转换，边转换边产出文本行"""
+    extractor = HTMLTextExtractor()
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+    yield from extractor.close()
+
 def parse_html_email_from_string(html_content):
     """从HTML字符串解析聊天记录"""
-    messages = []
-    
-    # 清理HTML
-    text = re.sub(r'<style[^>]*>.*?</style>', '', html_content, flags=re.DOTALL)
-    text = re.sub(r'<script[^>]*>.*?</script>', '', text, flags=re.DOTALL)
+    chunks = (html_content[i:i + HTML_CHUNK_SIZE]
+              for i in range(0, len(html_content), HTML_CHUNK_SIZE))
+    return parse_text_content(iter_html_lines(chunks))
+
+class ZipLimitError(Exception):
+    """ZIP成员解压后超出大小限制（可能是压缩炸弹）"""
+
+class _LimitedReader(io.RawIOBase):
+    """读取ZIP成员，解压出的字节数超过 limit 时抛出 ZipLimitError"""
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self.limit = limit
+        self.bytes_read = 0
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        count = self._stream.readinto(buffer)
+        self.bytes_read += count
+        if self.bytes_read > self.limit:
+            raise ZipLimitError(f"解压后超过 {self.limit} 字节")
+        return count
+    
+    def close(self):
+        """同时关闭ZIP成员的解压流"""
+        if not self.closed:
+            self._stream.close()
+        super().close()
+
+def parse_zip_attachment(zip_path, images=None):
+    """不解压到磁盘，直接在ZIP中逐个读取并解析文本/HTML成员
     
-    # 提取文本内容
-    text = re.sub(r'<[^>]+>', '\n', text)
-    text = html.unescape(text)
+    images 为列表时，图片成员读入内存追加到其中（与邮件中的图片一起交给图片提取）；
+    其他二进制成员跳过。每个成员和总解压大小都有上限，按实际解压出的字节数检查。
+    """
+    messages = []
+    remaining = ZIP_MAX_TOTAL_SIZE
     
-    # 解析为文本格式
-    messages = parse_text_content(text)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = zip_ref.infolist()
+        if len(members) > ZIP_MAX_MEMBERS:
+            print(f"  ZIP成员过多（{len(members)} 个），只处理前 {ZIP_MAX_MEMBERS} 个")
+            members = members[:ZIP_MAX_MEMBERS]
+        
+        for info in members:
+            # 成员名只用于判断类型和显示，不会用来写文件
+            name = Path(info.filename).name
+            ext = Path(name).suffix.lower()
+            is_text = ext in TEXT_ATTACHMENT_EXTENSIONS
+            is_image = images is not None and ext in IMAGE_EXTENSIONS
+            if info.is_dir() or not (is_text or is_image):
+                continue
+            if info.flag_bits & 0x1:
+                print(f"  跳过加密的ZIP成员: {info.filename}")
+                continue
+            
+            limit = min(ZIP_MAX_MEMBER_SIZE, remaining,
+                        max(info.compress_size * ZIP_MAX_RATIO, ZIP_MIN_RATIO_LIMIT))
+            if info.file_size > limit:
+                print(f"  跳过过大的ZIP成员: {info.filename} ({info.file_size} 字节)")
+                continue
+            
+            reader = _LimitedReader(zip_ref.open(info), limit)
+            try:
+                if is_text:
+                    stream = io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8', errors='replace')
+                    if ext == '.txt':
+                        messages.extend(parse_text_content(stream))
+                    else:
+                        messages.extend(parse_html_stream(stream))
+                else:
+                    data = io.BufferedReader(reader).read()
+                    if data:
+                        content_type = mimetypes.guess_type(name)[0] or 'image/jpeg'
+                        images.append({'filename': name, 'data': data, 'content_type': content_type,
+                                       'content_id': '', 'order': len(images)})
+            except ZipLimitError as e:
+                print(f"  ZIP成员 {info.filename} {e}，可能是压缩炸弹，停止处理该附件")
+                break
+            finally:
+                remaining -= reader.bytes_read
+                reader.close()
     
     return messages
 
-def parse_attachment(attach_path):
-    """解析附件文件"""
+def parse_attachment(attach_path, images=None):
+    """解析附件文件（images 为列表时，ZIP中的图片追加到其中）"""
     messages = []
     
     ext = attach_path.suffix.lower()
     
     if ext == '.txt':
         with open(attach_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        messages = parse_text_content(content)
+            messages = parse_text_content(f)
     elif ext in ['.html', '.htm']:
         messages = parse_html_email(attach_path)
     elif ext == '.zip':
-        # 解压ZIP文件
         try:
-            with zipfile.ZipFile(attach_path, 'r') as zip_ref:
-                extract_dir = CHAT_DIR / attach_path.stem
-                extract_dir.mkdir(exist_ok=True)
-                zip_ref.extractall(extract_dir)
-                
-                # 解析解压后的文件
-                for file in extract_dir.rglob('*'):
-                    if file.is_file():
-                        if file.suffix.lower() in ['.txt', '.html', '.htm']:
-                            file_messages = parse_attachment(file)
-                            messages.extend(file_messages)
+            messages = parse_zip_attachment(attach_path, images)
         except Exception as e:
             print(f"  解压失败: {e}")
     
     return messages
 
 def filter_by_date(messages, start_date="2025-09-01", end_date=None):
-    """按日期过滤消息"""
+    """按日期过滤消息
+    
+    messages 可以是消息列表或已建好的 Timeline；在按时间排序的时间线上二分查找，
+    返回日期范围内消息的零拷贝视图。无法识别日期的消息在 timeline.undated 中，没有时间戳的消息不保留。
+    """
     if end_date is None:
         end_date = datetime.now().strftime("%Y-%m-%d")
     
-    filtered = []
-    for msg in messages:
-        timestamp = msg.get('timestamp', '')
-        if not timestamp:
-            continue
-        
-        # 提取日期
-        date_match = re.search(r'(\d{4})[-/年](\d{1,2})[-/月](\d{1,2})', timestamp)
-        if date_match:
-            year, month, day = date_match.groups()
-            msg_date = f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-            if start_date <= msg_date <= end_date:
-                filtered.append(msg)
-        else:
-            # 如果没有日期信息，保留（可能是格式问题）
-            filtered.append(msg)
+    timeline = messages if isinstance(messages, Timeline) else build_timeline(messages)
+    return timeline.between(start_date, end_date)
+
+def build_timeline(messages):
+    """按时间戳排序消息，建立时间线（每条消息只解析一次时间）
+    
+    没有时间戳的消息不保留；有时间戳但无法识别日期的消息保留在 timeline.undated 中。
+    """
+    return Timeline([msg for msg in messages if msg.get('timestamp')],
+                    lambda msg: msg['timestamp'])
+
+def save_email_images(images, chat_file):
+    """把解析邮件时顺便收集的图片映射到聊天记录中的引用，并保存到CDN仓库"""
+    from extract_images_from_email import CDN_DIR, map_images_to_references, save_images_to_cdn
     
-    return filtered
+    print(f"\n找到 {len(images)} 张图片")
+    if not images:
+        return
+    image_map = map_images_to_references(images, chat_file)
+    print(f"映射了 {len(image_map)} 张图片到引用")
+    print(f"保存图片到: {CDN_DIR}")
+    saved_count = save_images_to_cdn(images, image_map)
+    print(f"总共新保存了 {saved_count} 张图片")
 
 def main():
     """主函数"""
+    arg_parser = argparse.ArgumentParser(description="邮件聊天记录提取工具")
+    arg_parser.add_argument("--images", action="store_true",
+                            help="同时提取邮件中的图片并保存到CDN仓库（邮件只解析一次）")
+    arg_parser.add_argument("--dedup-on-disk", action="store_true",
+                            help="去重用的消息摘要保存在磁盘临时文件中（聊天记录特别大时使用）")
+    args = arg_parser.parse_args()
+    
     print("=" * 60)
     print("邮件聊天记录提取工具")
     print("=" * 60)
@@ -495,45 +727,42 @@ def main():
     
     print(f"\n找到 {len(email_files)} 个邮件文件")
     
-    all_messages = []
-    
-    for email_file in email_files:
-        print(f"\n处理文件: {email_file.name}")
-        messages = extract_from_email_file(email_file)
-        all_messages.extend(messages)
-        print(f"  提取了 {len(messages)} 条消息")
-    
-    print(f"\n总共提取了 {len(all_messages)} 条消息")
-    
-    # 去重
     unique_messages = []
-    seen = set()
-    for msg in all_messages:
-        content = msg.get('content', '')
-        if content and content not in seen:
-            seen.add(content)
-            unique_messages.append(msg)
-    
-    print(f"去重后: {len(unique_messages)} 条消息")
-    
-    # 按日期过滤
-    filtered_messages = filter_by_date(unique_messages, "2025-09-01")
-    print(f"过滤后（2025-09-01至今）: {len(filtered_messages)} 条消息")
+    total = 0
+    images = [] if args.images else None
+    
+    # 每个文件提取完立即去重，重复的消息不会累积在内存中
+    with MessageDeduplicator(on_disk=args.dedup_on_disk) as dedup:
+        for email_file in email_files:
+            print(f"\n处理文件: {email_file.name}")
+            messages = extract_from_email_file(email_file, images=images)
+            total += len(messages)
+            unique_messages.extend(dedup.unique(messages))
+            print(f"  提取了 {len(messages)} 条消息")
+        
+        print(f"\n总共提取了 {total} 条消息")
+        print(f"去重后: {len(unique_messages)} 条消息（{dedup.summary()}）")
     
-    # 按时间排序
-    filtered_messages.sort(key=lambda x: x.get('timestamp', ''))
+    # 按时间排序，再按日期过滤（没有时间戳的丢弃；无法识别日期的保留，可能是格式问题）
+    timeline = build_timeline(unique_messages)
+    filtered_messages = filter_by_date(timeline, "2025-09-01")
+    print(f"过滤后（2025-09-01至今）: {len(timeline.undated) + len(filtered_messages)} 条消息")
     
     # 保存为文本文件
     output_file = CHAT_DIR / "email_chat_extracted.txt"
     with open(output_file, 'w', encoding='utf-8') as f:
-        for msg in filtered_messages:
-            timestamp = msg.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        for msg in itertools.chain(timeline.undated, filtered_messages):
+            timestamp = msg['timestamp']
             sender = msg.get('sender', '未知')
             content = msg.get('content', '')
             
             f.write(f"{timestamp} {sender} {content}\n")
     
     print(f"\n完成！已保存到: {output_file}")
+    print(f"正文解码: {decode_stats_summary()}")
+    
+    if images is not None:
+        save_email_images(images, output_file)
     print(f"\n下一步：运行 py scripts/parse_chat.py 进行进一步处理")
 
 if __name__ == "__main__":
@@ -6,6 +6,7 @@
 """
 
 import os
+import argparse
 import struct
 import sqlite3
 from pathlib import Path
@@ -13,6 +14,15 @@ from datetime import datetime
 import json
 import re
 import mmap
+import time
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+
+from dedup import MessageDeduplicator
+from sqlite_pool import ConnectionPool
+from text_decoding import DECODE_STATS, FALLBACK_ENCODINGS, decode_stats_summary, sniff_binary_encoding
 
 # 微信备份目录
 BACKUP_ROOT = Path(r"C:\Users\mmeng\Documents\xwechat_files\Backup\mengxiangzhi001\8a7ca2d8c851e71a7c9ce102bb3b7476\files\1")
@@ -25,38 +35,98 @@ IMAGES_DIR = PROJECT_ROOT / "assets" / "images"
 # 目标联系人（秋璇的微信名或备注）
 TARGET_CONTACT = "秋璇"
 
-def find_sqlite_databases(backup_dir):
-    """查找所有SQLite数据库文件"""
+# SQLite 数据库文件开头的16个字节
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+# 并行扫描备份目录的线程数
+SCAN_WORKERS = 8
+
+# 按字节查找聊天文件中可能有消息的位置：“您”“我”或目标联系人名字的第一个字。
+# 名字只查第一个字，因为忽略错误解码时无效字节两边的字会连在一起，整个名字在字节中不一定连续
+KEYWORD_BYTES = {encoding: re.compile(b'|'.join(re.escape(kw.encode(encoding))
+                                                for kw in (TARGET_CONTACT[0], "您", "我")))
+                 for encoding in FALLBACK_ENCODINGS}
+
+# 10-13位的数字（可能是秒或毫秒时间戳）
+TIMESTAMP_RUN = re.compile(r'(?<![0-9])[0-9]{10,13}(?![0-9])')
+
+# 按块解码聊天文件时每块的字节数
+SCAN_CHUNK_SIZE = 4 * 1024 * 1024
+
+# 保存调试用的原始文本时解码的字节数
+RAW_PREVIEW_BYTES = 4096
+
+# 并行提取时每个进程最多排队的任务数（限制同时在内存中的结果）
+MAX_IN_FLIGHT_PER_WORKER = 2
+
+def _scan_directory(path):
+    """扫描一个目录（不递归），只读取文件头判断是否为SQLite
+    
+    返回 (子目录列表, [(SQLite文件路径, 大小)], 扫描的文件数)。os.scandir 的目录项自带
+    文件类型（Windows 上还带大小），不需要为每个文件单独 stat。
+    """
+    subdirs, found, files = [], [], 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    files += 1
+                    size = entry.stat().st_size
+                    if size < 1024:  # 小于1KB的跳过
+                        continue
+                    with open(entry.path, 'rb') as f:
+                        if f.read(len(SQLITE_HEADER)) == SQLITE_HEADER:
+                            found.append((entry.path, size))
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return subdirs, found, files
+
+def find_sqlite_databases(backup_dir, pool, workers=SCAN_WORKERS):
+    """查找所有SQLite数据库文件（验证时打开的连接留在连接池中，提取时直接使用）
+    
+    多个线程并行扫描目录，只读取每个文件开头的16个字节；文件头是SQLite的才打开读取表名。
+    """
     db_files = []
     print("正在搜索SQLite数据库文件...")
     
-    for root, dirs, files in os.walk(backup_dir):
-        for file in files:
-            file_path = Path(root) / file
-            # 检查文件大小，跳过太小的文件
-            try:
-                if file_path.stat().st_size < 1024:  # 小于1KB的跳过
-                    continue
-            except:
-                continue
-            
-            # 尝试打开验证是否为SQLite
-            try:
-                conn = sqlite3.connect(str(file_path))
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                tables = [t[0] for t in cursor.fetchall()]
-                conn.close()
-                
-                if tables:
-                    db_files.append({
-                        'path': file_path,
-                        'tables': tables,
-                        'size': file_path.stat().st_size
-                    })
-                    print(f"  找到数据库: {file_path.name} ({len(tables)} 个表)")
-            except:
-                pass
+    start = time.perf_counter()
+    candidates = []
+    scanned = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_scan_directory, str(backup_dir))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirs, found, files = future.result()
+                scanned += files
+                candidates.extend(found)
+                pending.update(executor.submit(_scan_directory, subdir) for subdir in subdirs)
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    print(f"  扫描了 {scanned} 个文件，用时 {elapsed:.1f} 秒（{scanned / elapsed:.0f} 个/秒），"
+          f"{len(candidates)} 个是SQLite文件")
+    
+    # 按路径排序，结果与扫描顺序无关
+    for path, size in sorted(candidates):
+        file_path = Path(path)
+        try:
+            tables = pool.tables(file_path)
+        except Exception:
+            continue
+        
+        if tables:
+            db_files.append({
+                'path': file_path,
+                'tables': tables,
+                'size': size
+            })
+            print(f"  找到数据库: {file_path.name} ({len(tables)} 个表)")
     
     return db_files
 
@@ -96,86 +166,93 @@ def parse_wechat_backup_structure(backup_dir):
     print(f"找到 {len(chat_sessions)} 个聊天会话")
     return chat_sessions
 
-def read_binary_file(file_path, max_size=100*1024*1024):
-    """读取二进制文件（限制大小避免内存问题）"""
-    try:
-        file_size = file_path.stat().st_size
-        if file_size > max_size:
-            print(f"  警告: 文件 {file_path.name} 太大 ({file_size/1024/1024:.1f}MB)，跳过")
-            return None
-        
-        with open(file_path, 'rb') as f:
-            return f.read()
-    except Exception as e:
-        print(f"  读取文件失败 {file_path.name}: {e}")
-        return None
+def _looks_like_text(text):
+    """解码结果是否像文本（包含中文等非ASCII字符）"""
+    return len(text) > 10 and any(ord(c) > 127 for c in text[:100])
 
-def try_parse_as_text(data):
-    """尝试将二进制数据解析为文本"""
-    if not data:
-        return None
-    
-    # 尝试UTF-8编码
-    try:
-        text = data.decode('utf-8', errors='ignore')
-        if len(text) > 10 and any(ord(c) > 127 for c in text[:100]):  # 包含中文
-            return text
-    except:
-        pass
+def _iter_text_chunks(data, encoding, chunk_size=SCAN_CHUNK_SIZE):
+    """把映射的文件在换行符处切成约 chunk_size 字节的块，依次产出解码后的文本
     
-    # 尝试GBK编码
-    try:
-        text = data.decode('gbk', errors='ignore')
-        if len(text) > 10 and any(ord(c) > 127 for c in text[:100]):
-            return text
-    except:
-        pass
-    
-    return None
+    用字节正则先检查，不含关键字的块不解码（二进制数据通常大部分都是这种块）；
+    utf-8 和 gbk 的多字节字符中都不会出现换行符，逐块解码与整段解码后再分行的结果相同。
+    单独一行超过 chunk_size 时整行作为一块。
+    """
+    keyword_pattern = KEYWORD_BYTES[encoding]
+    size = len(data)
+    start = 0
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            cut = data.rfind(b'\n', start, end)
+            if cut < 0:
+                cut = data.find(b'\n', end)
+            end = size if cut < 0 else cut
+        if keyword_pattern.search(data, start, end):
+            yield data[start:end].decode(encoding, errors='ignore')
+        start = end + 1
 
-def extract_text_from_chat_file(chat_file_path):
-    """从聊天文件中提取文本内容"""
-    data = read_binary_file(chat_file_path)
-    if not data:
-        return []
+def _scan_text_lines(data, encoding):
+    """在映射的文件中查找包含目标联系人或“您”“我”的行"""
+    messages = []
+    for text in _iter_text_chunks(data, encoding):
+        for line in text.split('\n'):
+            if len(line.strip()) > 5 and (TARGET_CONTACT in line or "您" in line or "我" in line):
+                messages.append({
+                    'content': line.strip(),
+                    # 行内10-13位的数字（可能是时间戳），用于调试
+                    'time_candidates': [int(t) for t in TIMESTAMP_RUN.findall(line)]
+                })
+    return messages
+
+def extract_text_from_chat_file(chat_file_path, pool=None):
+    """从聊天文件中提取文本内容（聊天文件是SQLite数据库时用连接池 pool 打开）
     
+    文件以 mmap 只读映射，不读进内存，多大的文件都可以处理。
+    """
     messages = []
+    is_sqlite = False
+    try:
+        with open(chat_file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # 方法2: 查找SQLite数据库特征（是数据库时不需要按文本解析）
+                is_sqlite = data[:len(SQLITE_HEADER)] == SQLITE_HEADER
+                
+                # 方法1: 尝试解析为文本（只用前缀判断UTF-8/GBK）
+                encoding = None if is_sqlite else sniff_binary_encoding(data, _looks_like_text)
+                if encoding:
+                    messages = _scan_text_lines(data, encoding)
+                    if messages:
+                        raw = data[:RAW_PREVIEW_BYTES].decode(encoding, errors='ignore')[:500]
+                        for msg in messages:
+                            msg['raw'] = raw  # 保存原始文本的前500字符用于调试
+    except (OSError, ValueError) as e:
+        print(f"  读取文件失败 {chat_file_path.name}: {e}")
+        return []
     
-    # 方法1: 尝试解析为文本
-    text = try_parse_as_text(data)
-    if text:
-        # 尝试提取时间戳和消息内容
-        # 查找类似时间戳的模式
-        timestamp_pattern = r'(\d{10,13})'  # 10-13位数字（可能是时间戳）
-        time_matches = re.findall(timestamp_pattern, text[:1000])
-        
-        # 查找可能的发送者名称
-        if TARGET_CONTACT in text or "您" in text or "我" in text:
-            # 尝试提取消息内容
-            lines = text.split('\n')
-            for line in lines:
-                if len(line.strip()) > 5 and (TARGET_CONTACT in line or "您" in line or "我" in line):
-                    messages.append({
-                        'content': line.strip(),
-                        'raw': text[:500]  # 保存原始文本的前500字符用于调试
-                    })
-    
-    # 方法2: 查找SQLite数据库特征
-    if data[:16] == b'SQLite format 3\x00':
-        return extract_from_sqlite(chat_file_path)
+    if is_sqlite:
+        return extract_from_sqlite(chat_file_path, pool)
     
     return messages
 
-def extract_from_sqlite(db_path):
-    """从SQLite数据库提取聊天记录"""
+def extract_from_sqlite(db_path, pool=None):
+    """从SQLite数据库提取聊天记录
+    
+    pool 为连接池（复用查找数据库时打开的连接和读到的表名），为 None 时临时打开、用完关闭。
+    """
+    if pool is None:
+        with ConnectionPool() as pool:
+            return extract_from_sqlite(db_path, pool)
+    
     messages = []
     try:
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
+        cursor = pool.get(db_path).cursor()
         
         # 获取所有表名
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [t[0] for t in cursor.fetchall()]
+        tables = pool.tables(db_path)
         
         # 常见的微信聊天表名
         possible_tables = ['message', 'Chat', 'MSG', 'msg', 'Message']
@@ -202,14 +279,65 @@ def extract_from_sqlite(db_path):
                 except Exception as e:
                     print(f"    查询表 {table} 失败: {e}")
         
-        conn.close()
+        cursor.close()
+        pool.release(db_path)
     except Exception as e:
         print(f"  解析SQLite失败: {e}")
     
     return messages
 
-def process_backup_directory(backup_dir, output_file):
-    """处理整个备份目录"""
+def _extract_session(chat_files, pool=None):
+    """提取一个聊天会话 ChatPackage 中的所有文件"""
+    messages = []
+    for chat_file in chat_files:
+        if chat_file.is_file():
+            messages.extend(extract_text_from_chat_file(chat_file, pool))
+    return messages
+
+def _run_in_worker(func, arg):
+    """在子进程中执行任务
+    
+    先去掉任务内部的重复消息再传回主进程（聊天文件中大量重复的行不需要序列化），
+    返回 (消息, 去重前的条数, 去掉的重复条数, 这次执行的解码统计)；子进程的解码统计不会自动汇总到主进程。
+    """
+    before = DECODE_STATS.copy()
+    messages = func(arg)
+    with MessageDeduplicator() as dedup:
+        unique = list(dedup.unique(messages))
+    return unique, len(messages), dedup.dropped, DECODE_STATS - before
+
+def _run_tasks(tasks, workers):
+    """依次产出每个任务 (函数, 参数) 的结果 (消息, 提取的条数, 已去掉的重复条数)，按提交顺序
+    
+    workers 大于 1 时在进程池中并行执行，同时最多 workers * MAX_IN_FLIGHT_PER_WORKER 个任务
+    在执行或等待取走结果，任务再多内存占用也不会增长；workers 为 1 时逐个执行。
+    """
+    if workers <= 1:
+        for func, arg in tasks:
+            messages = func(arg)
+            yield messages, len(messages), 0
+        return
+    
+    window = workers * MAX_IN_FLIGHT_PER_WORKER
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for func, arg in tasks:
+            pending.append(executor.submit(_run_in_worker, func, arg))
+            while len(pending) >= window or (pending and pending[0].done()):
+                messages, count, dropped, stats = pending.popleft().result()
+                DECODE_STATS.update(stats)
+                yield messages, count, dropped
+        while pending:
+            messages, count, dropped, stats = pending.popleft().result()
+            DECODE_STATS.update(stats)
+            yield messages, count, dropped
+
+def process_backup_directory(backup_dir, output_file, dedup_on_disk=False, workers=1):
+    """处理整个备份目录（dedup_on_disk 为 True 时去重摘要保存在磁盘临时文件中）
+    
+    workers 大于 1 时多个数据库和聊天会话在进程池中并行提取；结果按顺序依次去重并写入文件，
+    输出与逐个提取时相同，已写入的消息不会留在内存中。
+    """
     print("=" * 60)
     print("开始处理微信备份文件")
     print("=" * 60)
@@ -217,72 +345,77 @@ def process_backup_directory(backup_dir, output_file):
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     IMAGES_DIR.mkdir(parents=True, exist_ok=True)
     
-    all_messages = []
+    total = 0
+    # 每批消息提取出来就去重，重复的消息不会累积在内存中
+    dedup = MessageDeduplicator(on_disk=dedup_on_disk)
+    pool = ConnectionPool()
     
     # 方法1: 查找SQLite数据库
     print("\n[方法1] 查找SQLite数据库...")
-    db_files = find_sqlite_databases(backup_dir)
-    
-    if db_files:
-        print(f"\n找到 {len(db_files)} 个数据库文件，开始提取...")
-        for db_info in db_files:
-            print(f"\n处理数据库: {db_info['path'].name}")
-            messages = extract_from_sqlite(db_info['path'])
-            all_messages.extend(messages)
-            print(f"  提取了 {len(messages)} 条消息")
+    db_files = find_sqlite_databases(backup_dir, pool)
     
     # 方法2: 解析目录结构
     print("\n[方法2] 解析目录结构...")
     sessions = parse_wechat_backup_structure(backup_dir)
     
+    # 逐个提取时复用查找数据库时打开的连接；并行时各进程自己打开
+    if workers > 1:
+        pool.close()
+        extract_database = extract_from_sqlite
+        extract_session = _extract_session
+    else:
+        extract_database = partial(extract_from_sqlite, pool=pool)
+        extract_session = partial(_extract_session, pool=pool)
+    tasks = itertools.chain(((extract_database, db_info['path']) for db_info in db_files),
+                            ((extract_session, session['chat_files']) for session in sessions))
+    
+    if db_files:
+        print(f"\n找到 {len(db_files)} 个数据库文件，开始提取...")
     if sessions:
         print(f"\n找到 {len(sessions)} 个聊天会话，开始提取...")
-        processed = 0
-        for session in sessions:
-            processed += 1
-            if processed % 10 == 0:
-                print(f"  已处理 {processed}/{len(sessions)} 个会话...")
-            
-            # 处理ChatPackage中的文件
-            for chat_file in session['chat_files']:
-                if chat_file.is_file():
-                    messages = extract_text_from_chat_file(chat_file)
-                    if messages:
-                        all_messages.extend(messages)
     
-    # 去重和排序
-    print(f"\n总共提取了 {len(all_messages)} 条原始消息")
-    
-    # 去重（基于内容）
-    unique_messages = []
-    seen = set()
-    for msg in all_messages:
-        content = msg.get('content', '')
-        if content and content not in seen:
-            seen.add(content)
-            unique_messages.append(msg)
-    
-    print(f"去重后: {len(unique_messages)} 条消息")
-    
-    # 写入输出文件
     output_path = OUTPUT_DIR / output_file
     print(f"\n正在写入文件: {output_path}")
     
     with open(output_path, 'w', encoding='utf-8') as f:
-        for i, msg in enumerate(unique_messages, 1):
-            content = msg.get('content', '').strip()
-            if content:
-                # 尝试提取时间戳
-                timestamp = msg.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-                sender = msg.get('sender', '未知')
-                
-                f.write(f"[{timestamp}] {sender}: {content}\n")
+        for i, (messages, count, dropped) in enumerate(_run_tasks(tasks, workers)):
+            if i < len(db_files):
+                print(f"\n处理数据库: {db_files[i]['path'].name}")
+                print(f"  提取了 {count} 条消息")
+            else:
+                processed = i - len(db_files) + 1
+                if processed % 10 == 0:
+                    print(f"  已处理 {processed}/{len(sessions)} 个会话...")
+            
+            total += count
+            dedup.dropped += dropped  # 子进程中已经去掉的重复消息
+            for msg in dedup.unique(messages):
+                content = msg.get('content', '').strip()
+                if content:
+                    # 尝试提取时间戳
+                    timestamp = msg.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                    sender = msg.get('sender', '未知')
+                    
+                    f.write(f"[{timestamp}] {sender}: {content}\n")
     
-    print(f"\n完成！已保存 {len(unique_messages)} 条消息到 {output_path}")
+    pool.close()
+    print(f"\n总共提取了 {total} 条原始消息")
+    print(f"去重后: {dedup.kept} 条消息（{dedup.summary()}）")
+    dedup.close()
+    
+    print(f"\n完成！已保存 {dedup.kept} 条消息到 {output_path}")
+    print(f"聊天文件解码: {decode_stats_summary()}")
     return output_path
 
 def main():
     """主函数"""
+    arg_parser = argparse.ArgumentParser(description="微信备份文件解析")
+    arg_parser.add_argument("--dedup-on-disk", action="store_true",
+                            help="去重用的消息摘要保存在磁盘临时文件中（聊天记录特别大时使用）")
+    arg_parser.add_argument("--workers", type=int, default=1,
+                            help="并行提取数据库和聊天会话的进程数（默认 1，即逐个提取）")
+    args = arg_parser.parse_args()
+    
     if not BACKUP_ROOT.exists():
         print(f"错误: 备份目录不存在: {BACKUP_ROOT}")
         print("请检查路径是否正确")
@@ -293,7 +426,8 @@ def main():
     
     # 处理备份
     output_file = "wechat_backup_extracted.txt"
-    result = process_backup_directory(BACKUP_ROOT, output_file)
+    result = process_backup_directory(BACKUP_ROOT, output_file, dedup_on_disk=args.dedup_on_disk,
+                                      workers=args.workers)
     
     if result:
         print("\n" + "=" * 60)
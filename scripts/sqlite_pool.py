@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+只读 SQLite 连接池
+每个数据库只打开一次连接，查找表和提取消息共用同一个连接。
+连接以 file:...?mode=ro&immutable=1 方式打开：备份副本不会被修改，SQLite 不需要加锁、
+不检查日志文件；并调大 mmap_size 和 cache_size，适合整表顺序扫描。
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+# 内存映射读取的上限（字节），超过部分按普通方式读取
+MMAP_SIZE = 256 * 1024 * 1024
+
+# 每个连接的页缓存大小（KB，PRAGMA cache_size 取负数时按 KB 计）
+CACHE_SIZE_KB = 64 * 1024
+
+# 同时保持打开的连接数，超过时关闭最久未使用的连接
+MAX_OPEN = 64
+
+
+def readonly_uri(db_path, immutable: bool = True) -> str:
+    """数据库文件的只读 URI（路径中的特殊字符由 as_uri 转义）"""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    return uri + "&immutable=1" if immutable else uri
+
+
+def _has_pending_wal(db_path) -> bool:
+    """是否有未合并的 WAL 文件（immutable 模式会忽略它，导致漏掉其中的数据）"""
+    try:
+        return Path(str(db_path) + "-wal").stat().st_size > 0
+    except OSError:
+        return False
+
+
+def open_readonly(db_path, immutable: bool = True) -> sqlite3.Connection:
+    """以只读方式打开数据库，并设置适合扫描的参数
+
+    immutable 为 True 时按不会变化的文件打开（备份副本）；有未合并的 WAL 文件时自动改为普通只读。
+    连接可以在其他线程中使用，但同一时间只应由一个线程使用。
+    """
+    if immutable and _has_pending_wal(db_path):
+        immutable = False
+    conn = sqlite3.connect(readonly_uri(db_path, immutable), uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class ConnectionPool:
+    """按数据库路径缓存只读连接和表名列表
+
+    immutable 为 False 时按普通只读方式打开（数据库可能正被微信写入时使用）。
+    """
+
+    def __init__(self, immutable: bool = True, max_open: int = MAX_OPEN):
+        self.immutable = immutable
+        self.max_open = max_open
+        self.opened = 0
+        self._conns: "OrderedDict[str, sqlite3.Connection]" = OrderedDict()
+        self._tables: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(db_path) -> str:
+        return str(Path(db_path).resolve())
+
+    def get(self, db_path) -> sqlite3.Connection:
+        """取得数据库的连接，第一次使用时打开"""
+        key = self._key(db_path)
+        with self._lock:
+            conn = self._conns.get(key)
+            if conn is not None:
+                self._conns.move_to_end(key)
+                return conn
+            conn = open_readonly(db_path, self.immutable)
+            self._conns[key] = conn
+            self.opened += 1
+            while len(self._conns) > self.max_open:
+                _, oldest = self._conns.popitem(last=False)
+                oldest.close()
+            return conn
+
+    def tables(self, db_path) -> List[str]:
+        """数据库中的表名（读取一次后缓存）；不是 SQLite 文件时抛出 sqlite3.DatabaseError 并关闭连接"""
+        key = self._key(db_path)
+        tables = self._tables.get(key)
+        if tables is None:
+            try:
+                tables = [t[0] for t in self.get(db_path).execute(
+                    "SELECT name FROM sqlite_master WHERE type='table'")]
+            except sqlite3.Error:
+                self.release(db_path)
+                raise
+            self._tables[key] = tables
+        return tables
+
+    def release(self, db_path):
+        """关闭某个数据库的连接（之后再使用时重新打开）"""
+        with self._lock:
+            conn = self._conns.pop(self._key(db_path), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+        for conn in conns:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本编码识别与解码
+优先使用邮件部分声明的字符集；没有声明或声明不可信时，只检查数据开头的一段来猜测编码，
+整段数据只解码一次。猜错时才逐个尝试（慢路径），并计数，方便查看慢路径出现的频率。
+"""
+
+import codecs
+from collections import Counter
+from typing import Callable, Optional
+
+# 没有声明字符集时依次尝试的编码（gb2312 是 gbk 的子集，不需要单独尝试）
+FALLBACK_ENCODINGS = ('utf-8', 'gbk')
+
+# 猜测编码时检查的前缀长度
+SNIFF_SIZE = 64 * 1024
+
+# 任何字节都能解码成功的声明（常见于误标的邮件），不能说明实际编码，交给前缀探测
+UNINFORMATIVE_CHARSETS = {'ascii', 'iso8859-1', 'cp1252'}
+
+# 解码统计：declared（按声明解码）、sniffed（前缀探测命中）、fallback（慢路径）
+DECODE_STATS = Counter()
+
+
+def _normalize_charset(charset) -> Optional[str]:
+    """把声明的字符集规范化为 Python 编码名，无法识别或不可信时返回 None"""
+    if not charset:
+        return None
+    try:
+        name = codecs.lookup(str(charset).strip().strip('"')).name
+    except LookupError:
+        return None
+    if name in UNINFORMATIVE_CHARSETS:
+        return None
+    return 'gbk' if name == 'gb2312' else name
+
+
+def _prefix_decodes(data: bytes, encoding: str, size: int) -> bool:
+    """判断数据前缀能否按 encoding 无错误解码（被截断的末尾多字节字符不算错误）"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        decoder.decode(data[:size], final=len(data) <= size)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def sniff_encoding(data: bytes, size: int = SNIFF_SIZE) -> Optional[str]:
+    """只检查前 size 个字节，猜测数据的编码，都不符合时返回 None"""
+    for encoding in FALLBACK_ENCODINGS:
+        if _prefix_decodes(data, encoding, size):
+            return encoding
+    return None
+
+
+def decode_bytes(data: bytes, declared: Optional[str] = None) -> str:
+    """把字节解码为文本
+
+    依次使用：声明的字符集 -> 前缀探测的编码 -> 逐个尝试 utf-8、gbk -> latin1（总能成功）。
+    与原来 utf-8 / gbk / gb2312 / latin1 逐个整段尝试的结果一致，但通常只整段解码一次。
+    """
+    charset = _normalize_charset(declared)
+    if charset:
+        try:
+            text = data.decode(charset)
+        except UnicodeDecodeError:
+            pass
+        else:
+            DECODE_STATS['declared'] += 1
+            return text
+
+    guess = sniff_encoding(data)
+    if guess:
+        try:
+            text = data.decode(guess)
+        except UnicodeDecodeError:
+            pass  # 错误出现在前缀之后
+        else:
+            DECODE_STATS['sniffed'] += 1
+            return text
+
+    DECODE_STATS['fallback'] += 1
+    for encoding in FALLBACK_ENCODINGS:
+        if encoding == guess:
+            continue
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('latin1')
+
+
+def sniff_binary_encoding(data, accept: Callable[[str], bool], size: int = SNIFF_SIZE) -> Optional[str]:
+    """按 utf-8、gbk 的顺序忽略错误解码前 size 个字节，返回第一个被 accept 接受的编码
+
+    data 可以是 bytes 或 mmap，只读取前缀。都不接受时返回 None（不是文本，不计入解码统计）；
+    第一个编码不被接受、第二个被接受时计为慢路径。
+    """
+    prefix = data[:size]
+    for i, encoding in enumerate(FALLBACK_ENCODINGS):
+        if accept(prefix.decode(encoding, errors='ignore')):
+            DECODE_STATS['sniffed' if i == 0 else 'fallback'] += 1
+            return encoding
+    return None
+
+
+def decode_stats_summary() -> str:
+    """解码统计的简短说明"""
+    return (f"按声明字符集 {DECODE_STATS['declared']} 次，前缀探测 {DECODE_STATS['sniffed']} 次，"
+            f"慢路径 {DECODE_STATS['fallback']} 次")
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+聊天记录时间线
+把消息按秒级时间戳排序，按日期范围查询时用二分查找定位，返回零拷贝的视图
+"""
+
+import re
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+
+# 兼容 2025/9/1 10:30、2025年9月1日 10:30:15 等写法
+LOOSE_TIMESTAMP = re.compile(
+    r'(\d{4})[-/年](\d{1,2})[-/月](\d{1,2})日?(?:[\sT,]+(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?'
+)
+
+
+def parse_epoch(timestamp) -> Optional[int]:
+    """把时间字符串转换为秒级时间戳（按本地时间直接换算，不做时区转换），无法识别时返回 None"""
+    try:
+        dt = datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        if not isinstance(timestamp, str):
+            return None
+        match = LOOSE_TIMESTAMP.search(timestamp)
+        if not match:
+            return None
+        try:
+            dt = datetime(*(int(part) for part in match.groups(default='0')))
+        except ValueError:
+            return None
+    return int((dt.replace(tzinfo=None) - EPOCH).total_seconds())
+
+
+def format_epoch(epoch: int) -> str:
+    """把秒级时间戳格式化为 2025-09-01 10:30:15 形式"""
+    return str(EPOCH + timedelta(seconds=epoch))
+
+
+def date_range(epochs: Sequence[int], start_date: str, end_date: str) -> Tuple[int, int]:
+    """在升序的时间戳序列中二分查找 [start_date, end_date] 两天（含）之间的下标范围"""
+    start = parse_epoch(start_date)
+    end = parse_epoch(end_date) + 86400  # 结束日期当天也包含在内
+    lo = bisect_left(epochs, start)
+    hi = bisect_left(epochs, end, lo)
+    return lo, hi
+
+
+class TimelineView:
+    """按下标范围引用原序列的只读视图，不复制元素"""
+    __slots__ = ('_items', '_start', '_stop')
+
+    def __init__(self, items: Sequence, start: int = 0, stop: Optional[int] = None):
+        self._items = items
+        self._start = start
+        self._stop = len(items) if stop is None else stop
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return TimelineView(self._items, self._start + start, self._start + max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("TimelineView index out of range")
+        return self._items[self._start + index]
+
+    def __iter__(self):
+        items = self._items
+        for i in range(self._start, self._stop):
+            yield items[i]
+
+
+class Timeline:
+    """按时间排序的消息序列
+
+    构建时每条消息只解析一次时间，之后的日期范围查询都是 O(log n) 的二分查找。
+    无法识别时间的消息不参与排序，单独保存在 undated 中。
+    """
+
+    def __init__(self, messages: List, timestamp_of: Callable[[object], str]):
+        dated = []
+        self.undated = []
+        for msg in messages:
+            epoch = parse_epoch(timestamp_of(msg))
+            if epoch is None:
+                self.undated.append(msg)
+            else:
+                dated.append((epoch, msg))
+        dated.sort(key=lambda pair: pair[0])
+        self.epochs = [epoch for epoch, _ in dated]
+        self.messages = [msg for _, msg in dated]
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def between(self, start_date: str, end_date: str) -> TimelineView:
+        """返回 [start_date, end_date] 之间（含两端日期）的消息视图"""
+        lo, hi = date_range(self.epochs, start_date, end_date)
+        return TimelineView(self.messages, lo, hi)